@@ -0,0 +1,102 @@
+'''
+Benchmarks downsampling of the report notebooks charts: report.ipynb hourly bars, and supercv.ipynb
+realtime areas, with realtime sampled every 5 minutes as the watch mode does.
+Compares the full series to the downsampled ones: plotted points, embedded figure size and time.
+Figures are built with plotly when installed, otherwise the size of the plotted columns as json is
+measured, which is what figures embed.
+Run from repository root: python -m benchmarks.bench_downsample
+'''
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+import src.downsample as downsample
+
+try:
+    import plotly.express as px
+except ImportError:
+    px = None
+
+
+def hourly(plants: int, years: int, rng):
+    '''
+    Generates an hourly aggregate, following a daylight curve.
+    '''
+    times = pd.date_range('2023-12-31', periods=years * 365 * 24,
+                          freq='-1h')[::-1].values
+    daylight = np.clip(np.sin(np.pi * (np.arange(len(times)) % 24 - 6) / 12), 0, None)
+    return pd.DataFrame({
+        'collect_time': np.tile(times, plants),
+        'plant_name': pd.Categorical(np.repeat(['Plant %d' % p for p in range(plants)], len(times))),
+        'inverter_power': (daylight * rng.uniform(0, 50, (plants, len(times)))).ravel()})
+
+
+def realtime(plants: int, days: int, rng):
+    '''
+    Generates realtime samples every 5 minutes, with an increasing total yield.
+    '''
+    times = pd.date_range('2023-12-31', periods=days * 288,
+                          freq='-5min')[::-1].values
+    total = np.cumsum(rng.uniform(0, 1, (plants, len(times))), axis=1)
+    return pd.DataFrame({
+        'collect_time': np.tile(times, plants),
+        'plant_name': pd.Categorical(np.repeat(['Plant %d' % p for p in range(plants)], len(times))),
+        'total_power': total.ravel(), 'day_power': total.ravel() % 100, 'month_power': total.ravel() % 1000})
+
+
+def figure(chart: str, data: pd.DataFrame):
+    '''
+    Builds chart figure and serializes it, or plotted columns if plotly isn't installed.
+    '''
+    if px is None:
+        return data.to_json(orient='split', date_format='iso')
+    if chart == 'hourly':
+        fig = px.bar(data, x='collect_time', y='inverter_power',
+                     color='plant_name')
+    else:
+        fig = px.area(data, x=data.collect_time.dt.date, y='total_power', color='plant_name',
+                      hover_data=['total_power', 'day_power', 'month_power'])
+    return fig.to_json()
+
+
+def measured(chart: str, data: pd.DataFrame, reduce):
+    begin = time.perf_counter()
+    reduced = reduce(data)
+    prepared = time.perf_counter()
+    size = len(figure(chart, reduced))
+    return len(reduced), size, prepared - begin, time.perf_counter() - prepared
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--plants', type=int, default=20,
+                        help='Number of plants')
+    parser.add_argument('-y', '--years', type=int, nargs='+', default=[1, 3],
+                        help='Years of hourly history. Example --years 1 3')
+    parser.add_argument('-d', '--days', type=int, nargs='+', default=[30, 365],
+                        help='Days of realtime history. Example --days 30 365')
+    parser.add_argument('-m', '--method', default='minmax', choices=downsample.methods(),
+                        help='Downsampling method, default=minmax')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    charts = [('hourly', '%dy' % years, hourly(args.plants, years, rng),
+               lambda data: downsample.view(data, 'collect_time', 'inverter_power', points=2000,
+                                            method=args.method))
+              for years in args.years]
+    charts += [('realtime', '%dd' % days, realtime(args.plants, days, rng),
+                lambda data: downsample.view(data, 'collect_time', 'total_power', points=1000,
+                                             by='plant_name', method=args.method))
+               for days in args.days]
+
+    print('Figures measured with %s.' %
+          ('plotly' if px else 'plotted columns json, plotly not installed'))
+    print('%8s %6s %10s %10s %10s %10s %10s %10s %10s' %
+          ('chart', 'range', 'rows', 'kept', 'size', 'kept size', 'render', 'reduce', 'kept rend.'))
+    for chart, extent, data, reduce in charts:
+        rows, size, _, render = measured(chart, data, lambda data: data)
+        reduced, reduced_size, reducing, reduced_render = measured(
+            chart, data, reduce)
+        print('%8s %6s %10d %10d %8.1fMB %8.1fMB %9.2fs %9.2fs %9.2fs' %
+              (chart, extent, rows, reduced, size / 2**20, reduced_size / 2**20, render, reducing, reduced_render))
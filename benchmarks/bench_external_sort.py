@@ -0,0 +1,73 @@
+'''
+Benchmarks aggregation of hourly partitions sorted and merged on disk within a memory budget, against
+the in memory aggregation. Partitions restate the previous day, as late collections do.
+Checks that aggregated files are identical, and measures time and peak memory.
+Run from repository root: python -m benchmarks.bench_external_sort
+'''
+import argparse
+import filecmp
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import src.std_utils as std_utils
+import etl_aggregate
+from benchmarks.bench_merge import generate
+
+
+def write(root: Path, files: int, plants: int):
+    '''
+    Writes generated hourly partitions as std layer files.
+    '''
+    begin = datetime(2023, 1, 1)
+    for index, frame in enumerate(generate(files, plants)):
+        std_utils.to_csv(frame, root / std_utils.format_filename(
+            'hourly', begin + timedelta(days=index)))
+
+
+def measured(source: Path, destination: Path, memory: int):
+    '''
+    Measures elapsed time, then peak memory in a second run as tracing slows execution down.
+    '''
+    def run():
+        etl_aggregate.aggregate_pattern(source, destination, 'hourly', {}, destination / 'manifest.json',
+                                        None, False, 'csv', memory)
+
+    begin = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - begin
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, destination / 'hourly.csv'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--files', type=int, nargs='+', default=[30, 365],
+                        help='Number of partitions to benchmark. Example --files 30 365')
+    parser.add_argument('-p', '--plants', type=int, default=100,
+                        help='Number of plants per partition')
+    parser.add_argument('-m', '--memory', type=int, nargs='+', default=[64, 16],
+                        help='Memory budgets in MB. Example --memory 64 16')
+    args = parser.parse_args()
+
+    print('%8s %10s %8s %10s %10s %10s' %
+          ('files', 'size', 'budget', 'time', 'peak', 'identical'))
+    for files in args.files:
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / 'std'
+            write(source, files, args.plants)
+            elapsed, peak, reference = measured(
+                source, Path(tmp) / 'memory', None)
+            print('%8d %8.1fMB %8s %9.2fs %8.1fMB %10s' %
+                  (files, reference.stat().st_size / 2**20, '-', elapsed, peak / 2**20, '-'))
+            for memory in args.memory:
+                elapsed, peak, output = measured(
+                    source, Path(tmp) / str(memory), memory * 2**20)
+                print('%8d %8.1fMB %6dMB %9.2fs %8.1fMB %10s' %
+                      (files, output.stat().st_size / 2**20, memory, elapsed, peak / 2**20,
+                       filecmp.cmp(reference, output, shallow=False)))
@@ -0,0 +1,100 @@
+'''
+Benchmarks hfs_utils.flatten against the number of plants of hourly and alarms payloads.
+Compares the former row by row implementation with the vectorized one, and checks both outputs match.
+Run from repository root: python -m benchmarks.bench_flatten
+'''
+import argparse
+import copy
+import time
+import numpy as np
+import pandas as pd
+import pytz
+import pyhfs
+
+import src.hfs_utils as hfs_utils
+
+
+def hourly_payload(plants: int, rng):
+    '''
+    Generates an hourly data payload, 24 points per plant.
+    '''
+    begin = 1688162400000
+    return [{'stationCode': 'NE=%08d' % p,
+             'collectTime': begin + h * 3600000,
+             'dataItemMap': {'radiation_intensity': rng.random(),
+                             'theory_power': rng.random() * 10,
+                             'inverter_power': rng.random() * 10,
+                             'ongrid_power': None,
+                             'power_profit': rng.random()}}
+            for p in range(plants) for h in range(24)]
+
+
+def alarms_payload(plants: int, rng):
+    '''
+    Generates an alarms payload, 2 alarms per plant.
+    '''
+    return [{'stationCode': 'NE=%08d' % p,
+             'stationName': 'Plant %d' % p,
+             'alarmId': 2064,
+             'alarmName': 'Low insulation resistance',
+             'esnCode': 'ES%08d' % p,
+             'lev': int(rng.integers(1, 5)),
+             'raiseTime': 1688162400000 + int(rng.integers(0, 1 << 32)),
+             'status': 1}
+            for p in range(plants) for _ in range(2)]
+
+
+def flatten_loop(data, timezone):
+    '''
+    Former implementation, building rows one by one.
+    '''
+    def iterate(data):
+        for entry in data:
+            line = entry.get('dataItemMap')
+            if line:
+                line['stationCode'] = entry['stationCode']
+            else:
+                line = entry
+
+            # Copy collect time
+            if 'collectTime' in entry.keys():
+                line['collectTime'] = entry['collectTime']
+
+            # Fix up time
+            dates = ['collectTime', 'raiseTime']
+            for date in dates:
+                if date in line.keys():
+                    utc_date = pyhfs.Client.from_timestamp(line[date])
+                    line[date] = utc_date.astimezone(timezone)
+            yield line
+
+    return pd.DataFrame(iterate(data))
+
+
+def timed(func, *args):
+    begin = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - begin, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--plants', type=int, nargs='+', default=[10, 100, 1000, 5000],
+                        help='Number of plants to benchmark. Example --plants 100 1000')
+    args = parser.parse_args()
+
+    tz = pytz.timezone('Europe/Paris')
+    rng = np.random.default_rng(0)
+
+    print('%8s %8s %10s %10s %8s' %
+          ('dataset', 'plants', 'loop', 'vector', 'speedup'))
+    for plants in args.plants:
+        for name, generate in [('hourly', hourly_payload), ('alarms', alarms_payload)]:
+            data = generate(plants, rng)
+            # Former implementation mutates its input, so it gets its own copy
+            loop, reference = timed(flatten_loop, copy.deepcopy(data), tz)
+            vector, result = timed(hfs_utils.flatten, data, tz)
+            pd.testing.assert_frame_equal(reference, result)
+
+            print('%8s %8d %9.3fs %9.3fs %7.1fx' %
+                  (name, plants, loop, vector, loop / vector))
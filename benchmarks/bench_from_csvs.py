@@ -0,0 +1,79 @@
+'''
+Benchmarks std_utils.from_csvs load time against the number of daily partitions.
+Compares the former quadratic concat loop with the bulk loader, on thread and process pools.
+Run from repository root: python -m benchmarks.bench_from_csvs
+'''
+import argparse
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import src.std_utils as std_utils
+
+
+def generate(root: Path, files: int, plants: int, offset: str = ''):
+    '''
+    Generates 'files' daily hourly partitions for 'plants' plants.
+    offset is appended to times, ie: +02:00 as in standardized files.
+    '''
+    rng = np.random.default_rng(0)
+    begin = datetime(2023, 1, 1)
+    for day in range(files):
+        date = begin + timedelta(days=day)
+        times = [(date + timedelta(hours=h)).strftime('%Y-%m-%d %H:%M:%S') + offset
+                 for h in range(24)]
+        df = pd.DataFrame({
+            'plant_code': np.repeat(['NE=%08d' % p for p in range(plants)], 24),
+            'collect_time': times * plants,
+            'inverter_power': rng.random(24 * plants) * 10,
+            'radiation_intensity': rng.random(24 * plants),
+            'theory_power': rng.random(24 * plants) * 10})
+        std_utils.to_csv(df, root / std_utils.format_filename('hourly', date))
+
+
+def from_csvs_loop(path: Path, pattern: str):
+    '''
+    Former implementation, concatenating files one by one.
+    '''
+    aggregated = pd.DataFrame()
+    for filename in sorted(path.glob(pattern)):
+        aggregated = pd.concat([aggregated, std_utils.from_csv(filename)])
+    return std_utils.merge([aggregated])
+
+
+def timed(func, *args):
+    begin = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - begin, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--files', type=int, nargs='+', default=[30, 100, 365, 730],
+                        help='Number of files to benchmark. Example --files 30 365')
+    parser.add_argument('-p', '--plants', type=int, default=20,
+                        help='Number of plants per file')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of concurrent loaders')
+    args = parser.parse_args()
+
+    print('%8s %10s %10s %10s' % ('files', 'loop', 'threads', 'processes'))
+    for files in args.files:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            generate(root, files, args.plants)
+            pattern = '**/hourly_*.csv'
+
+            loop, reference = timed(from_csvs_loop, root, pattern)
+            threads, result = timed(
+                std_utils.from_csvs, root, pattern, args.jobs, False)
+            pd.testing.assert_frame_equal(reference, result)
+            processes, result = timed(
+                std_utils.from_csvs, root, pattern, args.jobs, True)
+            pd.testing.assert_frame_equal(reference, result)
+
+            print('%8d %9.2fs %9.2fs %9.2fs' %
+                  (files, loop, threads, processes))
@@ -0,0 +1,82 @@
+'''
+Benchmarks std_utils.merge keyed on dataset primary key, against the former whole row duplicates removal.
+Each daily partition also restates the previous day with updated values, as late collections do.
+Measures merge time, peak memory and the number of merged rows.
+Run from repository root: python -m benchmarks.bench_merge
+'''
+import argparse
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+import src.std_utils as std_utils
+
+
+def generate(files: int, plants: int, restated: float = .1):
+    '''
+    Generates 'files' typed daily hourly partitions for 'plants' plants, each also restating
+    the previous day, with 'restated' ratio of changed values.
+    '''
+    rng = np.random.default_rng(0)
+    codes = np.repeat(['NE=%08d' % p for p in range(plants)], 24)
+
+    def day(date, power):
+        return pd.DataFrame({
+            'plant_code': pd.Categorical(codes),
+            'collect_time': np.tile(pd.date_range(date, periods=24, freq='h').values, plants),
+            'inverter_power': power,
+            'radiation_intensity': power / 10,
+            'theory_power': power * 1.1})
+
+    frames = []
+    powers = [rng.random(24 * plants) * 10 for _ in range(files)]
+    begin = datetime(2023, 1, 1)
+    for index in range(files):
+        frame = day(begin + timedelta(days=index), powers[index])
+        if index:
+            previous = powers[index - 1].copy()
+            changed = rng.random(previous.size) < restated
+            previous[changed] = rng.random(changed.sum()) * 10
+            frame = pd.concat(
+                [day(begin + timedelta(days=index - 1), previous), frame])
+        frames.append(frame)
+    return frames
+
+
+def measured(func, frames):
+    '''
+    Measures elapsed time, then peak memory in a second run as tracing slows execution down.
+    '''
+    begin = time.perf_counter()
+    result = func([f.copy() for f in frames])
+    elapsed = time.perf_counter() - begin
+    copies = [f.copy() for f in frames]
+    tracemalloc.start()
+    func(copies)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--files', type=int, nargs='+', default=[30, 365],
+                        help='Number of partitions to benchmark. Example --files 30 365')
+    parser.add_argument('-p', '--plants', type=int, default=100,
+                        help='Number of plants per partition')
+    args = parser.parse_args()
+
+    keys = std_utils.primary_keys()['hourly']
+    print('%8s %10s %10s %10s %10s %10s %10s' %
+          ('files', 'rows', 'keyed', 'whole', 'keyed mem', 'whole mem', 'whole rows'))
+    for files in args.files:
+        frames = generate(files, args.plants)
+        whole, whole_peak, reference = measured(std_utils.merge, frames)
+        keyed, keyed_peak, result = measured(
+            lambda frames: std_utils.merge(frames, keys), frames)
+        assert not result.duplicated(subset=keys).any()
+
+        print('%8d %10d %9.2fs %9.2fs %8.1fMB %8.1fMB %10d' %
+              (files, len(result), keyed, whole, keyed_peak / 2**20, whole_peak / 2**20, len(reference)))
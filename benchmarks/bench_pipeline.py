@@ -0,0 +1,186 @@
+'''
+Benchmarks the whole ETL pipeline on a synthetic fleet of N plants over M years:
+collect (backfill then daily collection, answered by the mock Northbound interface), standardize,
+aggregate with rollups, then upload and download of data to an in-process Drive.
+Measures each stage time, then peak memory in a second run, and the number and size of output files.
+Results are written as json, and compared to a baseline results file if provided: exits with an error
+if any stage is slower or uses more memory than the baseline by more than the tolerance.
+Run from repository root: python -m benchmarks.bench_pipeline
+'''
+import argparse
+import json
+import logging
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+import pytz
+from pathlib import Path
+from datetime import datetime
+
+import etl_collect_fus
+import etl_standardize
+import etl_aggregate
+from benchmarks.synthetic import FakeDrive, generate_std
+
+stages = ['collect', 'standardize', 'aggregate', 'upload', 'download']
+
+
+def files_size(path: Path):
+    '''
+    Gets the number of files below path, and their total size.
+    '''
+    files = [f for f in path.rglob('*') if f.is_file()]
+    return len(files), sum(f.stat().st_size for f in files)
+
+
+def measured(func, *args):
+    '''
+    Measures elapsed time, then peak memory in a second run as tracing slows execution down.
+    Each run gets its own output, the first one is returned.
+    '''
+    begin = time.perf_counter()
+    output = func(*args, 'timed')
+    elapsed = time.perf_counter() - begin
+    tracemalloc.start()
+    func(*args, 'traced')
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, output
+
+
+def run(root: Path, mock: dict, begin: datetime, end: datetime, selected: list, config: Path, jobs: int):
+    '''
+    Runs selected stages, each one from previous stage output.
+    mock is the mock Northbound interface session options.
+    If standardize stage isn't selected, std layer is generated directly from the mock interface.
+    '''
+    tz = pytz.timezone('Europe/Paris')
+    results = {}
+
+    def collect(run):
+        raw = root / 'raw' / run
+        etl_collect_fus.backfill(raw, 'user', 'password', begin, end, tz, mock, jobs=jobs)
+        etl_collect_fus.collect(raw, 'user', 'password', end, tz, mock, jobs=jobs)
+        return raw
+
+    def standardize(raw, run):
+        std = root / 'std' / run
+        etl_standardize.standardize(raw, std, config, full=True, workers=jobs)
+        return std
+
+    def aggregate(std, run):
+        agg = root / 'agg' / run
+        etl_aggregate.aggregate(std, agg, full=True, workers=jobs)
+        etl_aggregate.rollup(agg)
+        return agg
+
+    def upload(std, agg, run):
+        # Uploads std and aggregated layers, as the nightly job does
+        drive = FakeDrive(jobs=jobs)
+        drive.upload(std, 'root', Path('std'), '*')
+        if agg:
+            drive.upload(agg, 'root', Path('agg'), '*')
+        return drive
+
+    def download(drive, run):
+        local = root / 'download' / run
+        local.mkdir(parents=True)
+        drive.download(local, 'root', Path('.'), '*')
+        return local
+
+    def record(name, elapsed, peak, output):
+        files, size = files_size(output) if isinstance(output, Path) else (
+            len(output.contents), output.size())
+        results[name] = {'time': elapsed, 'peak': peak, 'files': files, 'bytes': size}
+        print('%12s %9.2fs %8.1fMB %8d %8.1fMB' %
+              (name, elapsed, peak / 2**20, files, size / 2**20))
+        return output
+
+    print('%12s %10s %10s %8s %10s' % ('stage', 'time', 'peak', 'files', 'size'))
+    raw = agg = drive = None
+    if 'collect' in selected:
+        raw = record('collect', *measured(collect))
+    if 'standardize' in selected:
+        if raw is None:
+            sys.exit('standardize stage requires collect stage.')
+        std = record('standardize', *measured(standardize, raw))
+    else:
+        std = root / 'std' / 'generated'
+        generate_std(std, mock, begin, end, tz, config)
+    if 'aggregate' in selected:
+        agg = record('aggregate', *measured(aggregate, std))
+    if 'upload' in selected:
+        drive = record('upload', *measured(upload, std, agg))
+    if 'download' in selected:
+        if drive is None:
+            sys.exit('download stage requires upload stage.')
+        record('download', *measured(download, drive))
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    '''
+    Compares results with baseline ones, returning regressed stages.
+    '''
+    regressions = []
+    print('%12s %10s %10s' % ('stage', 'time', 'peak'))
+    for name, result in results['stages'].items():
+        reference = baseline['stages'].get(name)
+        if not reference:
+            continue
+        ratios = {metric: result[metric] / max(reference[metric], 1e-9)
+                  for metric in ['time', 'peak']}
+        print('%12s %9.2fx %9.2fx' % (name, ratios['time'], ratios['peak']))
+        regressions += [name + ' ' + metric for metric, ratio in ratios.items()
+                        if ratio > 1 + tolerance]
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--plants', type=int, default=20,
+                        help='Number of plants of the synthetic fleet, default=20')
+    parser.add_argument('-y', '--years', type=int, default=1,
+                        help='Number of years of history, ending on 2023-12-31, default=1')
+    parser.add_argument('-s', '--stages', nargs='+', default=stages, choices=stages,
+                        help='Stages to benchmark, default to all. Example --stages aggregate upload download')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Synthetic fleet seed, default=0')
+    parser.add_argument('-j', '--jobs', type=int, default=3,
+                        help='Maximum number of concurrent requests and workers, default=3')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Results json file. Example --output results.json')
+    parser.add_argument('-b', '--baseline', default=None,
+                        help='Baseline results json file to compare with')
+    parser.add_argument('-t', '--tolerance', type=float, default=.2,
+                        help='Tolerated increase of time and memory over baseline, default=0.2')
+    parser.add_argument('-ll', '--loglevel', default='warning',
+                        help='Logging level. Example --loglevel debug, default=warning')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.loglevel.upper())
+
+    config = {'plants': args.plants, 'years': args.years, 'seed': args.seed, 'jobs': args.jobs}
+    begin, end = datetime(2024 - args.years, 1, 1), datetime(2023, 12, 31)
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {'config': config,
+                   'environment': {'python': platform.python_version(), 'pandas': pd.__version__,
+                                   'machine': platform.machine(), 'date': datetime.now().isoformat()},
+                   'stages': run(Path(tmp), {'plants': args.plants, 'seed': args.seed}, begin, end, args.stages,
+                                 Path('src/fus2std.json'), args.jobs)}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['config'] != config:
+            logging.warning('Baseline configuration %s differs from %s.' % (baseline['config'], config))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            sys.exit('Regressions over baseline: %s.' % ', '.join(regressions))
@@ -0,0 +1,95 @@
+'''
+Benchmarks std_utils.from_csvs with declared schemas against the former untyped loading,
+which parsed dates element by element. Measures load time, peak memory and loaded frame size.
+Run from repository root: python -m benchmarks.bench_schemas
+'''
+import argparse
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+from pathlib import Path
+
+import src.std_utils as std_utils
+from benchmarks.bench_from_csvs import generate
+
+
+def typify_untyped(df: pd.DataFrame):
+    '''
+    Former typify implementation.
+    '''
+    cats = ['plant_code', 'plant_name', 'build_state', 'health_state']
+    for col in df.columns:
+        if col in cats:
+            df[col] = pd.Categorical(df[col])
+
+    dates = ['collect_time', 'alarm_raise_time']
+    for col in df.columns:
+        if col in dates:
+            if isinstance(df[col].dtype, pd.DatetimeTZDtype):
+                df[col] = df[col].dt.tz_localize(None)
+            elif not pd.api.types.is_datetime64_dtype(df[col]):
+                df[col] = pd.to_datetime(df[col], utc=False, format='mixed').map(
+                    lambda x: x.replace(tzinfo=None))
+    return df
+
+
+def from_csvs_untyped(path: Path, pattern: str):
+    '''
+    Former implementation, with inferred types and element wise dates parsing.
+    '''
+    filenames = sorted(path.glob(pattern))
+    frames = [typify_untyped(std_utils.from_csv(f, typed=False))
+              for f in filenames]
+    aggregated = pd.concat(frames)
+    for col in aggregated.select_dtypes('category'):
+        aggregated[col] = aggregated[col].astype(object)
+    aggregated.fillna(0, inplace=True)
+    aggregated = typify_untyped(aggregated)
+    aggregated.drop_duplicates(inplace=True, keep='last')
+    return aggregated
+
+
+def size(df: pd.DataFrame):
+    return df.memory_usage(deep=True).sum()
+
+
+def measured(func, *args):
+    '''
+    Measures elapsed time, then peak memory in a second run as tracing slows execution down.
+    '''
+    begin = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - begin
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--files', type=int, nargs='+', default=[30, 365],
+                        help='Number of files to benchmark. Example --files 30 365')
+    parser.add_argument('-p', '--plants', type=int, default=20,
+                        help='Number of plants per file')
+    args = parser.parse_args()
+
+    print('%8s %10s %10s %12s %12s %12s %12s' %
+          ('files', 'untyped', 'schema', 'untyped peak', 'schema peak', 'untyped size', 'schema size'))
+    for files in args.files:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            generate(root, files, args.plants, '+02:00')
+            pattern = '**/hourly_*.csv'
+
+            untyped, untyped_peak, reference = measured(
+                from_csvs_untyped, root, pattern)
+            typed, typed_peak, result = measured(
+                std_utils.from_csvs, root, pattern, 1)
+            pd.testing.assert_frame_equal(reference, result)
+
+            print('%8d %9.2fs %9.2fs %10.1fMB %10.1fMB %10.1fMB %10.1fMB' %
+                  (files, untyped, typed, untyped_peak / 2**20, typed_peak / 2**20,
+                   size(reference) / 2**20, size(result) / 2**20))
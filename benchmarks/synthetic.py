@@ -0,0 +1,114 @@
+'''
+Synthetic std layer generated from the mock Northbound interface, and an in-process fake Drive,
+so that the whole pipeline can be benchmarked offline.
+Generated data only depend on the fleet size, the seed and the requested dates.
+'''
+import hashlib
+import itertools
+import json
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+import src.std_utils as std_utils
+from src.gdrive import GoogleDriveClient
+from src.providers import FusionSolar
+import etl_collect_fus
+import etl_standardize
+
+
+def generate_std(root: Path, mock: dict, begin: datetime, end: datetime, tz, config: Path, format: str = 'csv'):
+    '''
+    Writes std layer partitions from begin to end dates, in std_utils.format_filename layout:
+    collected datasets as backfill would, plus realtime and alarms every day. Empty datasets (ie: a day
+    without alarms) aren't written, as standardization skips them.
+    Datasets are requested through the Fusion Solar provider, mock being its MockSession options.
+    Returns the number of written files.
+    '''
+    with open(config) as f:
+        plan = etl_standardize.compile_config(json.load(f))
+    partitions = etl_collect_fus.backfill_plan(begin, end) + [('plants', end)]
+    day = begin
+    while day.date() <= end.date():
+        partitions += [('realtime', day.replace(hour=12)), ('alarms', day)]
+        day = day + timedelta(days=1)
+
+    written = 0
+    with FusionSolar({'mock': mock}, tz) as provider:
+        plants = provider.plants()
+        codes = provider.plant_codes(plants)
+        for name, date in partitions:
+            if name == 'plants':
+                frame = plants
+            elif name == 'alarms':
+                frame = provider.alarms(codes, date - timedelta(days=1), date)
+            else:
+                frame = provider.series(name, codes, date)
+            if frame.empty:
+                continue
+            std_utils.to_csv(etl_standardize.remap(frame, plan),
+                             root / std_utils.format_filename(name, date, format))
+            written += 1
+    return written
+
+
+class FakeFile(dict):
+    '''
+    Drive file metadata, with its content kept in memory by FakeDrive.
+    '''
+
+    def __init__(self, drive, metadata: dict):
+        super().__init__(metadata)
+        self.drive = drive
+        self.content = None
+
+    def FetchMetadata(self, *args, **kwargs):
+        self.update(self.drive.files[self['id']])
+
+    def SetContentFile(self, filename: str):
+        with open(filename, 'rb') as f:
+            self.content = f.read()
+
+    def GetContentFile(self, filename: str, *args, **kwargs):
+        with open(filename, 'wb') as f:
+            f.write(self.drive.contents[self['id']])
+
+    def Upload(self, *args, **kwargs):
+        self.drive.store(self)
+
+    def Trash(self, *args, **kwargs):
+        del self.drive.files[self['id']]
+        self.drive.contents.pop(self['id'], None)
+
+
+class FakeDrive(GoogleDriveClient):
+    '''
+    In-process Drive, storing files in memory. Only the root folder exists initially, its id is 'root'.
+    Files are all uploaded at once, so chunk_size shall be bigger than any file.
+    '''
+
+    def __init__(self, jobs: int = 8, compress: bool = False):
+        super().__init__(auth=None, jobs=jobs, compress=compress, chunk_size=1 << 40)
+        self.files = {'root': {'id': 'root', 'title': '', 'parents': [],
+                               'mimeType': 'application/vnd.google-apps.folder'}}
+        self.contents = {}
+        self.ids = itertools.count(1)
+
+    def CreateFile(self, metadata=None):
+        return FakeFile(self, metadata or {})
+
+    def list_folder(self, id: str):
+        for file in list(self.files.values()):
+            if file['parents'] and file['parents'][0]['id'] == id:
+                yield FakeFile(self, file)
+
+    def store(self, file: FakeFile):
+        file.setdefault('id', str(next(self.ids)))
+        if file.content is not None:
+            self.contents[file['id']] = file.content
+            file.update({'md5Checksum': hashlib.md5(file.content).hexdigest(),
+                         'fileSize': str(len(file.content)),
+                         'modifiedDate': datetime.now(timezone.utc).isoformat()})
+        self.files[file['id']] = {k: v for k, v in file.items()}
+
+    def size(self):
+        return sum(len(content) for content in self.contents.values())
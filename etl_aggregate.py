@@ -4,30 +4,247 @@ import logging
 import argparse
 import glob
 import json
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 
 import src.std_utils as std_utils
+import src.manifest as manifest
+import src.instrument as instrument
+import src.external_sort as external_sort
 
 
-def aggregate(source: Path, destination: Path):
+def incremental_partitions(partitions: dict, known: dict, dfile: Path):
+    '''
+    Returns the list of partitions to merge into the existing aggregated file, or None
+    if aggregated file must be fully rebuilt.
+    Merging is only possible if all known partitions are unchanged, and new ones come
+    after them in loading order, so that result is identical to a full rebuild.
+    '''
+    if not known or not dfile.exists():
+        return None
+    for name, entry in known.items():
+        if name not in partitions or not manifest.unchanged(partitions[name], entry):
+            logging.info('Partition %s changed since last aggregation.' % name)
+            return None
+    names = list(partitions)
+    new = [name for name in names if name not in known]
+    if new and names.index(new[0]) < len(known):
+        logging.info('Partition %s predates aggregated ones.' % new[0])
+        return None
+    return new
+
+
+def aggregate(source: Path, destination: Path, full: bool = False, workers: int = None, processes: bool = False, format: str = 'csv',
+              memory: int = None):
+    manifest_file = destination / 'manifest.json'
+    manifests = {} if full else manifest.load(manifest_file)
+
     for pattern in std_utils.file_patterns():
-        search_pattern = '**/' + pattern + '_*.csv'
+        with instrument.stage('aggregate', pattern, profile=True):
+            aggregate_pattern(source, destination, pattern, manifests,
+                              manifest_file, workers, processes, format, memory)
+
+
+def aggregate_pattern(source: Path, destination: Path, pattern: str, manifests: dict, manifest_file: Path,
+                      workers: int, processes: bool, format: str, memory: int = None):
+    '''
+    Aggregates partitions of a dataset pattern, merging only new ones if manifest allows it.
+    If memory is specified, csv aggregated files are sorted and merged within this budget in bytes,
+    instead of in memory, see external_sort.sort_merge(). Output is the same.
+    '''
+    search_pattern = '**/' + pattern + '_*.*'
+    dfile = destination / (pattern + '.' + format)
+
+    partitions = {str(filename.relative_to(source)): filename
+                  for filename in std_utils.partition_files(source.glob(search_pattern))}
+    new = incremental_partitions(
+        partitions, manifests.get(pattern, {}), dfile)
+
+    if new is not None and not new:
+        logging.info('Aggregated file %s is up to date.' % dfile)
+        return
+
+    if memory and format == 'csv':
+        files = list(partitions.values()) if new is None else [
+            dfile] + [partitions[name] for name in new]
+        logging.info('Sorting and merging %d files with pattern %s, within %d MB.' %
+                     (len(files), search_pattern, memory // 2**20))
+        with instrument.stage('sort_merge', pattern):
+            rows = external_sort.sort_merge(files, dfile, sort_columns(
+                set().union(*map(std_utils.file_columns, files))),
+                std_utils.primary_keys().get(pattern), memory, destination)
+        instrument.count('read', pattern, files=len(files))
+        if not rows:
+            logging.info('No data for pattern: %s.' % search_pattern)
+            return
+        instrument.count('aggregate', pattern, rows=rows,
+                         bytes=dfile.stat().st_size, files=1)
+    else:
+        if new is None:
+            logging.info('Aggregating files with pattern: %s.' %
+                         search_pattern)
+            with instrument.stage('read', pattern):
+                aggregated = std_utils.from_csvs(
+                    source, search_pattern, workers, processes)
+            instrument.count('read', pattern, files=len(partitions))
+        else:
+            logging.info('Merging %d new files with pattern: %s.' %
+                         (len(new), search_pattern))
+            with instrument.stage('read', pattern):
+                aggregated = std_utils.merge(std_utils.read_csvs(
+                    [dfile] + [partitions[name] for name in new], workers, processes),
+                    std_utils.primary_keys().get(pattern))
+            instrument.count('read', pattern, files=len(new) + 1)
 
-        logging.info('Aggregating files with pattern: %s.' % search_pattern)
-        aggregated = std_utils.from_csvs(source, search_pattern)
         if aggregated.empty:
             logging.info('No data for pattern: %s.' % search_pattern)
-            continue
-        by = (['collect_time']
-              if 'collect_time' in aggregated else []) + ['plant_code']
-        aggregated.sort_values(by=by, inplace=True)
+            return
+        write_aggregated(aggregated, dfile, pattern)
 
-        dfile = destination / (pattern + '.csv')
-        logging.info('Outputting file: %s.' % dfile)
+    manifests[pattern] = {name: manifest.fingerprint(filename)
+                          for name, filename in partitions.items()}
+    manifest.save(manifests, manifest_file)
+
+
+def sort_columns(columns):
+    '''
+    Gets the columns aggregated data is sorted by: time and plant.
+    '''
+    return (['collect_time'] if 'collect_time' in columns else []) + ['plant_code']
+
+
+def write_aggregated(aggregated: pd.DataFrame, dfile: Path, pattern: str):
+    '''
+    Sorts aggregated data by time and plant, and outputs it.
+    '''
+    with instrument.stage('sort', pattern):
+        aggregated.sort_values(by=sort_columns(
+            aggregated), inplace=True, kind='stable')
 
+    logging.info('Outputting file: %s.' % dfile)
+    with instrument.stage('write', pattern):
         std_utils.to_csv(aggregated, dfile)
+    instrument.count('aggregate', pattern, rows=len(aggregated),
+                     bytes=dfile.stat().st_size, files=1)
+
+
+def aggregate_fresh(source: Path, destination: Path, fresh: dict, format: str = 'csv'):
+    '''
+    Merges freshly standardized partitions into aggregated files, without loading them again.
+    fresh is a dict of partition file -> dataframe, partitions files being already written below source.
+    Fresh partitions are merged into the aggregated file if they come after all other known partitions
+    in loading order, so that they win over previous data as a full rebuild would. Known partitions are
+    trusted from manifest, so source only needs to hold fresh partitions, and aggregated files are never
+    rebuilt from it.
+    A pattern whose aggregated file can't be merged into (fresh partitions predating known ones, or
+    missing manifest) is left unchanged, it must be rebuilt from the whole std layer with aggregate().
+    Returns the list of such patterns.
+    '''
+    manifest_file = destination / 'manifest.json'
+    manifests = manifest.load(manifest_file)
+
+    patterns = {}
+    for filename, frame in fresh.items():
+        patterns.setdefault(std_utils.dataset(filename), {})[
+            str(filename.relative_to(source))] = (filename, frame)
+
+    stale = []
+    for pattern in std_utils.file_patterns():
+        partitions = patterns.get(pattern)
+        if not partitions:
+            continue
+        with instrument.stage('aggregate', pattern, profile=True):
+            dfile = destination / (pattern + '.' + format)
+            known = manifests.get(pattern, {}) if dfile.exists() else {}
+            older = [std_utils.partition_key(name)
+                     for name in known if name not in partitions]
+            if dfile.exists() and (not known or max(older, default=()) > min(map(std_utils.partition_key, partitions))):
+                logging.error('Fresh %s partitions predate aggregated ones, or %s has no manifest. Skipping update.' %
+                              (pattern, dfile))
+                stale.append(pattern)
+                continue
+
+            logging.info('Merging %d fresh partitions into %s.' %
+                         (len(partitions), dfile))
+            frames = [frame.copy() for _, frame in (
+                partitions[name] for name in sorted(partitions, key=std_utils.partition_key))]
+            with instrument.stage('read', pattern):
+                if dfile.exists():
+                    frames.insert(0, std_utils.from_csv(dfile))
+                aggregated = std_utils.merge(
+                    frames, std_utils.primary_keys().get(pattern))
+            instrument.count('read', pattern, files=int(dfile.exists()))
+            if aggregated.empty:
+                logging.info('No data for pattern: %s.' % pattern)
+                continue
+            write_aggregated(aggregated, dfile, pattern)
+
+            manifests[pattern] = {**known, **{name: manifest.fingerprint(filename)
+                                              for name, (filename, _) in partitions.items()}}
+            manifest.save(manifests, manifest_file)
+    return stale
+
+
+def rollup_windows():
+    '''
+    Gets rolling windows of rollups, as a dict of name -> (duration, dataset giving the maximum yield
+    over such a duration). Lifetime window has no duration nor maximum.
+    '''
+    return {'1d': (timedelta(days=1), 'daily'),
+            '30d': (timedelta(days=30), 'monthly'),
+            '365d': (timedelta(days=365), 'yearly'),
+            'lifetime': (None, None)}
+
+
+def rollup(destination: Path, format: str = 'csv'):
+    '''
+    Materializes summary tables from aggregated files, so that dashboards don't need to scan hourly data:
+    - latest: latest realtime snapshot of each plant.
+    - windows: yield of each plant over rolling windows ending at latest collection, with the maximum
+    yield over the window duration and specific yield (kWh/kWp).
+    '''
+    def load(pattern: str, columns: list):
+        dfile = destination / (pattern + '.' + format)
+        if not dfile.exists():
+            return pd.DataFrame(columns=columns)
+        return std_utils.from_csvs(destination, dfile.name, columns=columns)
+
+    plants = load('plants', ['plant_code', 'plant_name', 'capacity'])
+    hourly = load('hourly', ['plant_code', 'collect_time', 'inverter_power'])
+    if plants.empty or hourly.empty:
+        logging.info('No data to rollup.')
+        return
+
+    realtime = load('realtime', None)
+    if 'collect_time' in realtime:
+        latest = realtime[realtime.groupby('plant_code', observed=True)['collect_time'].transform(
+            'max') == realtime['collect_time']]
+        logging.info('Outputting latest snapshot of %d plants.' % len(latest))
+        std_utils.to_csv(latest, destination / ('latest.' + format))
+        instrument.count('rollup', 'latest', rows=len(latest), files=1)
+        end = realtime['collect_time'].max()
+    else:
+        end = hourly['collect_time'].max()
+
+    windows = []
+    for name, (duration, maximum) in rollup_windows().items():
+        in_range = hourly if duration is None else hourly[(hourly['collect_time'] >= end - duration)
+                                                          & (hourly['collect_time'] <= end)]
+        window = in_range.groupby('plant_code', observed=True)[
+            'inverter_power'].sum().to_frame(name='total')
+        window['max'] = np.nan
+        if maximum:
+            window['max'] = load(maximum, ['plant_code', 'inverter_power']).groupby(
+                'plant_code', observed=True)['inverter_power'].max().astype('float64')
+        window['window'] = name
+        windows.append(window.reset_index())
+    windows = pd.merge(pd.concat(windows), plants, on=['plant_code'])
+    windows['perpower_ratio'] = windows['total'] / windows['capacity']
+    logging.info('Outputting %d windows rollups.' % len(windows))
+    std_utils.to_csv(windows, destination / ('windows.' + format))
+    instrument.count('rollup', 'windows', rows=len(windows), files=1)
 
 
 if __name__ == '__main__':
@@ -39,10 +256,32 @@ if __name__ == '__main__':
                         help='Source directory')
     parser.add_argument('-d', '--destination', required=True,
                         help='Destination directory')
+    parser.add_argument('-f', '--full', default=False, action=argparse.BooleanOptionalAction,
+                        help='Rebuilds aggregated files from all partitions, ignoring manifest')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of concurrent file loaders, default to executor default')
+    parser.add_argument('-p', '--processes', default=False, action=argparse.BooleanOptionalAction,
+                        help='Loads files on a process pool instead of a thread pool')
+    parser.add_argument('-r', '--rollup', default=True, action=argparse.BooleanOptionalAction,
+                        help='Materializes dashboards summary tables from aggregated files')
+    parser.add_argument('-fmt', '--format', default='csv', choices=std_utils.storage_formats(),
+                        help='Aggregated files storage format, default=csv')
+    parser.add_argument('-m', '--memory', type=int, default=None,
+                        help='Sorts and merges csv aggregated files on disk within this memory budget in MB, instead of in memory')
+    parser.add_argument('--report', default=None,
+                        help='Writes stages metrics to this json file at exit')
+    parser.add_argument('--profile', default=None,
+                        help='Dumps cProfile and tracemalloc statistics of each pattern aggregation and rollup to this directory')
     parser.add_argument('-ll', '--loglevel', default='info',
                         help='Logging level. Example --loglevel debug, default=info')
     args = parser.parse_args()
 
     logging.basicConfig(level=args.loglevel.upper())
+    instrument.setup(args.report, args.profile)
 
-    aggregate(Path(args.source), Path(args.destination))
+    aggregate(Path(args.source), Path(args.destination),
+              args.full, args.jobs, args.processes, args.format,
+              args.memory * 2**20 if args.memory else None)
+    if args.rollup:
+        with instrument.stage('rollup', profile=True):
+            rollup(Path(args.destination), args.format)
@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import logging
+import argparse
+import contextlib
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+import pytz
+
+import src.std_utils as std_utils
+import src.instrument as instrument
+from src.providers import providers
+from src.scheduler import Scheduler, failures
+from etl_collect_fus import query, query_alarms
+
+
+def load_accounts(path: Path):
+    '''
+    Loads accounts json file: {"accounts": [account, ...], "budgets": {provider: jobs}}.
+    Each account has a "provider" name, an optional "name" used as output sub folder, and provider
+    specific keys (credentials...). String values starting with '$' are read from environment variables,
+    so that secrets don't need to be written to the file.
+    '''
+    with open(path) as f:
+        accounts = json.load(f)
+
+    def expand(value):
+        if isinstance(value, str) and value.startswith('$'):
+            return os.environ.get(value[1:], '')
+        return value
+    accounts['accounts'] = [{k: expand(v) for k, v in account.items()}
+                            for account in accounts['accounts']]
+    unknown = {a['provider'] for a in accounts['accounts']} - providers().keys()
+    if unknown:
+        sys.exit('Unknown providers: %s. Available ones are: %s.' %
+                 (', '.join(unknown), ', '.join(providers())))
+    return accounts
+
+
+def account_output(output: Path, account: dict):
+    '''
+    Gets account raw tree, output/<provider>[/<name>]. Unnamed accounts write to the provider root.
+    '''
+    path = output / account['provider']
+    return path / account['name'] if account.get('name') else path
+
+
+def account_key(account: dict):
+    return account['provider'] + ('/' + account['name'] if account.get('name') else '')
+
+
+def collect_provider(output: Path, cls, accounts: list, date: datetime, tz: pytz.timezone, format: str,
+                     jobs: int, retries: int, backoff: float, alarms_overlap: timedelta):
+    '''
+    Collects all accounts of a provider, sharing a single scheduler so that no more than 'jobs' requests
+    are in flight for the provider, whatever the number of accounts. Datasets are written as
+    etl_collect_fus.collect() does, see etl_collect_fus.query().
+    Returns a dict of account key -> list of failed datasets.
+    '''
+    scheduler = Scheduler(jobs=jobs, retries=retries, backoff=backoff,
+                          is_retryable=cls.is_throttled)
+    failed = {}
+    with contextlib.ExitStack() as stack:
+        opened = {}
+        for account in accounts:
+            try:
+                opened[account_key(account)] = (
+                    stack.enter_context(cls(account, tz)), account_output(output, account))
+            except Exception as e:
+                logging.error('Failed to open %s account: %s' %
+                              (account_key(account), repr(e)))
+                failed[account_key(account)] = ['session']
+
+        # Plants are needed by all other queries
+        outcomes = scheduler.run({key: (query, path, 'plants', date, format, provider.plants)
+                                  for key, (provider, path) in opened.items()})
+        tasks = {}
+        for key, (provider, path) in opened.items():
+            if outcomes[key]['error']:
+                failed[key] = ['plants']
+                continue
+            codes = provider.plant_codes(outcomes[key]['result'])
+            for granularity in provider.granularities:
+                tasks[(key, granularity)] = (query, path, granularity, date, format,
+                                             provider.series, granularity, codes, date)
+            tasks[(key, 'alarms')] = (query_alarms, provider, path, date, format, codes,
+                                      alarms_overlap)
+        for key, name in failures(scheduler.run(tasks)):
+            failed.setdefault(key, []).append(name)
+    return failed
+
+
+def collect(output: Path, accounts: dict, date: datetime, tz: pytz.timezone, format: str = 'csv',
+            jobs: int = 3, retries: int = 3, backoff: float = 30., alarms_overlap: timedelta = timedelta(days=1)):
+    '''
+    Collects all accounts, providers being collected concurrently, each one within its own request budget:
+    accounts['budgets'][provider], default to 'jobs'.
+    Returns a dict of account key -> list of failed datasets, empty if all succeeded.
+    '''
+    by_provider = {}
+    for account in accounts['accounts']:
+        by_provider.setdefault(account['provider'], []).append(account)
+    budgets = accounts.get('budgets', {})
+
+    registry = providers()
+    with instrument.stage('collect', profile=True), ThreadPoolExecutor(max_workers=max(1, len(by_provider))) as pool:
+        futures = [pool.submit(collect_provider, output, registry[name], provider_accounts, date, tz, format,
+                               budgets.get(name, jobs), retries, backoff, alarms_overlap)
+                   for name, provider_accounts in by_provider.items()]
+        failed = {}
+        for future in futures:
+            failed.update(future.result())
+    for key, names in failed.items():
+        logging.error('Failed to collect %s: %s.' % (key, ', '.join(names)))
+    return failed
+
+
+if __name__ == '__main__':
+    '''
+    Collects data of several accounts and providers concurrently.
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-a', '--accounts', required=True,
+                        help='Accounts json file, see load_accounts()')
+    parser.add_argument('-o', '--output', default='data/raw',
+                        help='Raw data root directory, holding a tree per provider, default=data/raw')
+    parser.add_argument('-d', '--date', default='',
+                        help='Collection date in ISO 8601 format. Example --date 2023-07-17, default to now')
+    parser.add_argument('-t', '--timezone',
+                        default='Europe/Paris', help='Timezone')
+    parser.add_argument('-fmt', '--format', default='csv', choices=std_utils.storage_formats(),
+                        help='Raw files storage format, default=csv')
+    parser.add_argument('-j', '--jobs', type=int, default=3,
+                        help='Default maximum number of concurrent requests per provider, default=3')
+    parser.add_argument('-r', '--retries', type=int, default=3,
+                        help='Maximum number of retries of a throttled request, default=3')
+    parser.add_argument('-b', '--backoff', type=float, default=30.,
+                        help='First retry delay in seconds, doubled for each retry, default=30')
+    parser.add_argument('--alarms_overlap', type=float, default=1.,
+                        help='Days of alarms collected again before each plant watermark, to catch late updates, default=1')
+    parser.add_argument('--report', default=None,
+                        help='Writes stages and api calls metrics to this json file at exit')
+    parser.add_argument('--profile', default=None,
+                        help='Dumps cProfile and tracemalloc statistics of collection to this directory')
+    parser.add_argument('-ll', '--loglevel', default='info',
+                        help='Logging level. Example --loglevel debug, default=info')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.loglevel.upper())
+    instrument.setup(args.report, args.profile)
+
+    date = datetime.fromisoformat(
+        args.date) if args.date else datetime.now(tz=timezone.utc)
+
+    failed = collect(Path(args.output), load_accounts(Path(args.accounts)), date,
+                     pytz.timezone(args.timezone), args.format, args.jobs, args.retries, args.backoff,
+                     timedelta(days=args.alarms_overlap))
+    if failed:
+        sys.exit('Failed to collect %d accounts.' % len(failed))
@@ -1,114 +1,476 @@
+import io
 import logging
 import sys
+import json
 import argparse
+import threading
+import time
+import signal
+import contextlib
 import pandas as pd
 from pathlib import Path
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import pytz
 
 import pyhfs
-# from pyhfs.pyhfs.tests.mock_session import MockSession
 
 import src.std_utils as std_utils
 import src.hfs_utils as hfs_utils
+import src.instrument as instrument
+import src.watermarks as watermarks
+from src.providers import FusionSolar
+from src.scheduler import Scheduler, failures
+from src.ring_buffer import RingBuffer
 
 
-def collect(output: Path, username: str, password: str, date: datetime, tz: pytz.timezone, mock: bool):
+@contextlib.contextmanager
+def provider_session(username: str, password: str, tz: pytz.timezone, mock):
     '''
-    Query all plants data from Fusion Solar Northbound interface.
+    Opens a Fusion Solar provider, exiting on interface errors.
+    mock replaces the interface with a local MockSession, see providers.fusion_solar_session().
     '''
-
     try:
-        '''session=MockSession() if mock else'''
-        with pyhfs.Client(pyhfs.Session(user=username, password=password)) as client:
-
-            logging.info('Querying plants list.')
-            plants = client.get_plant_list()
-            logging.info('- Found ' + str(len(plants)) + ' plants:')
-            [logging.info(' - ' + plant['plantName'] +
-                          ' (' + plant['plantCode'] + ')') for plant in plants]
-            std_utils.to_csv(pd.DataFrame(plants), output /
-                             std_utils.format_filename('plants', date))
-
-            # Extract the list of plants code
-            plants_code = [plant['plantCode'] for plant in plants]
-
-            # Realtime data
-            logging.info('Querying realtime data.')
-            realtime = client.get_plant_realtime_data(plants_code)
-            for entry in realtime:  # Adds time information
-                entry.update({'collectTime': client.to_timestamp(date)})
-            logging.info('- Found ' + str(len(realtime)) + ' realtime data')
-            std_utils.to_csv(hfs_utils.flatten(realtime, tz), output /
-                             std_utils.format_filename('realtime', date))
-
-            # Hourly data
-            logging.info('Querying hourly data.')
-            hourly = client.get_plant_hourly_data(plants_code, date)
-            logging.info('- Found ' + str(len(hourly)) + ' hourly data')
-            std_utils.to_csv(hfs_utils.flatten(hourly, tz), output /
-                             std_utils.format_filename('hourly', date))
-
-            # Daily data
-            logging.info('Querying daily data.')
-            daily = client.get_plant_daily_data(plants_code, date)
-            logging.info('- Found ' + str(len(daily)) + ' daily data')
-            std_utils.to_csv(hfs_utils.flatten(daily, tz), output /
-                             std_utils.format_filename('daily', date))
-
-            # Monthly data
-            logging.info('Querying monthly data.')
-            monthly = client.get_plant_monthly_data(plants_code, date)
-            logging.info('- Found ' + str(len(monthly)) + ' monthly data')
-            std_utils.to_csv(hfs_utils.flatten(monthly, tz), output /
-                             std_utils.format_filename('monthly', date))
-
-            # Yearly data
-            logging.info('Querying yearly data.')
-            yearly = client.get_plant_yearly_data(plants_code, date)
-            logging.info('- Found ' + str(len(yearly)) + ' yearly data')
-            std_utils.to_csv(hfs_utils.flatten(yearly, tz), output /
-                             std_utils.format_filename('yearly', date))
-
-            # Alarms data
-            logging.info('Querying alarms data.')
-            alarms = client.get_alarms_list(
-                plants_code, datetime(2000, 1, 1), date)
-            logging.info('- Found ' + str(len(alarms)) + ' alarms')
-            std_utils.to_csv(hfs_utils.flatten(alarms, tz), output /
-                             std_utils.format_filename('alarms', date))
-
+        with FusionSolar({'username': username, 'password': password, 'mock': mock}, tz) as provider:
+            yield provider
     except pyhfs.LoginFailed:
         sys.exit(
             'Login failed. Verify user and password for FusionSolar Northbound interface account.')
-    except pyhfs.FrequencyLimit:
-        sys.exit('FusionSolar Northbound interface access frequency is too high.')
+    except pyhfs.FrequencyLimit as e:
+        if hfs_utils.is_throttled(e):
+            sys.exit('FusionSolar Northbound interface access frequency is too high.')
+        sys.exit('FusionSolar Northbound interface daily calls limit is reached.')
     except pyhfs.Permission:
         sys.exit('Missing permission to access FusionSolar Northbound interface.')
 
 
+def frequency_scheduler(jobs: int, retries: int, backoff: float):
+    '''
+    Scheduler running up to 'jobs' concurrent requests. A request hitting the interface frequency
+    limit is retried with exponential backoff, starting from 'backoff' seconds, unless it's the daily
+    limit, see hfs_utils.is_throttled().
+    '''
+    return Scheduler(jobs=jobs, retries=retries, backoff=backoff,
+                     is_retryable=FusionSolar.is_throttled)
+
+
+def query_plants(provider: FusionSolar, scheduler: Scheduler, output: Path, date: datetime, format: str):
+    '''
+    Queries and outputs plants list, returning it as a dataframe.
+    '''
+    logging.info('Querying plants list.')
+    outcome = scheduler.attempt('plants', provider.plants)
+    if outcome['error']:
+        raise outcome['error']
+    plants = outcome['result']
+    logging.info('- Found ' + str(len(plants)) + ' plants:')
+    [logging.info(' - ' + name + ' (' + code + ')')
+     for name, code in zip(plants.get('plantName', []), plants.get('plantCode', []))]
+    dfile = output / std_utils.format_filename('plants', date, format)
+    std_utils.to_csv(plants, dfile)
+    instrument.count('query', 'plants', rows=len(plants),
+                     bytes=dfile.stat().st_size, files=1)
+    return plants
+
+
+def merged_keys():
+    '''
+    Gets the columns identifying an entry of datasets whose partition is written by several collections,
+    see write_merged(): realtime samples, by daily collection and watch mode, and alarms, by daily
+    collection and backfill. They're standardized to the dataset primary key, see std_utils.primary_keys().
+    '''
+    return {'realtime': ['stationCode', 'collectTime'],
+            'alarms': ['stationCode', 'esnCode', 'alarmId', 'raiseTime']}
+
+
+def write_merged(frame: pd.DataFrame, dfile: Path, keys: list):
+    '''
+    Writes entries to their partition, after the entries it already holds, as several collections write
+    the same partition (see merged_keys()). An entry collected twice (same keys) is only kept once, the
+    latest one.
+    Partition is rewritten atomically, with the columns of both. csv partitions are merged as text, so
+    that entries already written are written back unchanged.
+    Returns the whole partition, loaded as from_csv(typed=False) does.
+    '''
+    try:
+        if dfile.suffix == '.csv':
+            existing = pd.read_csv(dfile, dtype=str, keep_default_na=False)
+        else:
+            existing = std_utils.from_csv(dfile, typed=False)
+    except (FileNotFoundError, pd.errors.EmptyDataError):
+        std_utils.to_csv(frame, dfile)
+        return frame
+    if dfile.suffix == '.csv' and len(frame.columns):
+        frame = pd.read_csv(io.StringIO(frame.to_csv(index=False)),
+                            dtype=str, keep_default_na=False)
+    frame = pd.concat([existing, frame], ignore_index=True)
+    if dfile.suffix == '.csv':  # Columns missing from one of them
+        frame.fillna('', inplace=True)
+    keys = [col for col in keys if col in frame]
+    frame = frame[~frame.duplicated(subset=keys or None, keep='last')]
+    std_utils.to_csv(frame, dfile)
+    if dfile.suffix == '.csv':  # Merged as text, parsed back from partition
+        frame = std_utils.from_csv(dfile, typed=False)
+    return frame
+
+
+def query(output: Path, name: str, date: datetime, format: str, get, *args):
+    '''
+    Queries a dataset with get(*args), a providers.Provider method, and outputs it to its partition file.
+    Realtime samples and alarms are added to their partition, see write_merged().
+    Returns the dataset, or the whole partition it was added to, including entries collected before.
+    '''
+    logging.info('Querying %s data.' % name)
+    with instrument.stage('query', name):
+        data = get(*args)
+        rows = len(data)
+        logging.info('- Found %d %s data in %s' % (rows, name, output))
+        dfile = output / std_utils.format_filename(name, date, format)
+        if name in merged_keys():
+            data = write_merged(data, dfile, merged_keys()[name])
+        else:
+            std_utils.to_csv(data, dfile)
+    instrument.count('query', name, rows=rows,
+                     bytes=dfile.stat().st_size, files=1)
+    return data
+
+
+def query_alarms(provider, output: Path, date: datetime, format: str, plants_code: list, overlap: timedelta):
+    '''
+    Queries alarms raised since each plant watermark, the end of its last successful alarms collection,
+    minus an overlap to catch late updates. Plants without watermark are queried since 2000.
+    Watermarks are stored in output/.alarms.json, and only move once alarms are written.
+    '''
+    wfile = output / '.alarms.json'
+    marks = watermarks.load(wfile)
+
+    def get():
+        frames = [provider.alarms(codes, begin, date)
+                  for begin, codes in watermarks.windows(marks, plants_code, overlap).items()]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    data = query(output, 'alarms', date, format, get)
+    watermarks.save(wfile, {**marks, **{code: date for code in plants_code}})
+    return data
+
+
+def raise_failures(outcomes: dict):
+    '''
+    Collected datasets are already written, reports the first failure.
+    '''
+    failed = failures(outcomes)
+    if failed:
+        logging.error('Failed to collect: %s.' % ', '.join(failed))
+        raise outcomes[failed[0]]['error']
+
+
+def collect(output: Path, username: str, password: str, date: datetime, tz: pytz.timezone, mock, format: str = 'csv',
+            jobs: int = 3, retries: int = 3, backoff: float = 30., alarms_overlap: timedelta = timedelta(days=1)):
+    '''
+    Query all plants data from Fusion Solar Northbound interface.
+    Datasets are queried concurrently, by up to 'jobs' simultaneous requests. A query hitting the
+    interface frequency limit is retried with exponential backoff, starting from 'backoff' seconds.
+    Each dataset is written as soon as it's received. Returns a dict of dataset name -> collected data.
+    Alarms are collected incrementally, see query_alarms().
+    '''
+    scheduler = frequency_scheduler(jobs, retries, backoff)
+
+    with instrument.stage('collect', profile=True), provider_session(username, password, tz, mock) as provider:
+        plants = query_plants(provider, scheduler, output, date, format)
+        plants_code = provider.plant_codes(plants)
+
+        outcomes = scheduler.run({
+            **{name: (query, output, name, date, format, provider.series, name, plants_code, date)
+               for name in provider.granularities},
+            'alarms': (query_alarms, provider, output, date, format, plants_code, alarms_overlap)})
+        raise_failures(outcomes)
+    return {'plants': plants, **{name: outcome['result'] for name, outcome in outcomes.items()}}
+
+
+def backfill_plan(begin: datetime, end: datetime):
+    '''
+    Lists the minimum set of (dataset, date) queries covering [begin, end]:
+    hourly data per day, daily data per month, monthly and yearly data per year.
+    '''
+    plan = []
+    day = begin
+    while day.date() <= end.date():
+        plan.append(('hourly', day))
+        if day == begin or day.day == 1:
+            plan.append(('daily', day))
+        if day == begin or (day.month == 1 and day.day == 1):
+            plan.append(('monthly', day))
+            plan.append(('yearly', day))
+        day = day + timedelta(days=1)
+    return plan
+
+
+def period_end(name: str, date: datetime):
+    '''
+    Gets the end of the period covered by a dataset partition.
+    '''
+    if name == 'hourly':
+        return datetime(date.year, date.month, date.day) + timedelta(days=1)
+    if name == 'daily':
+        return datetime(date.year + date.month // 12, date.month % 12 + 1, 1)
+    return datetime(date.year + 1, 1, 1)
+
+
+def is_complete(path: Path, name: str, date: datetime):
+    '''
+    A partition is complete if it was written after the end of its period.
+    '''
+    return path.exists() and path.stat().st_mtime > period_end(name, date).timestamp()
+
+
+def backfill(output: Path, username: str, password: str, begin: datetime, end: datetime, tz: pytz.timezone, mock,
+             format: str = 'csv', jobs: int = 3, retries: int = 3, backoff: float = 30.):
+    '''
+    Collects historical data from begin to end dates, within a single session.
+    Partitions that are already complete are skipped. Progress is checkpointed, so that an interrupted
+    backfill resumes where it stopped when run again with the same dates.
+    Realtime data can't be collected for the past, alarms are collected once for the whole period, which
+    sets the alarms watermark of plants that don't have one yet. They're added to the end date partition,
+    next to the alarms of daily collection, see write_merged().
+    '''
+    checkpoint_file = output / '.backfill.json'
+    checkpoint = {'from': begin.isoformat(), 'to': end.isoformat(), 'done': []}
+    if checkpoint_file.exists():
+        with open(checkpoint_file) as f:
+            previous = json.load(f)
+        if (previous['from'], previous['to']) == (checkpoint['from'], checkpoint['to']):
+            logging.info('Resuming backfill, %d partitions already collected.' %
+                         len(previous['done']))
+            checkpoint = previous
+
+    lock = threading.Lock()
+
+    def mark_done(partition: str):
+        with lock:
+            checkpoint['done'].append(partition)
+            with open(checkpoint_file, 'w') as f:
+                json.dump(checkpoint, f, indent=1)
+
+    plan = []
+    for name, date in backfill_plan(begin, end):
+        partition = str(std_utils.format_filename(name, date, format))
+        if partition in checkpoint['done'] or is_complete(output / partition, name, date):
+            logging.debug('Skipping complete partition %s.' % partition)
+        else:
+            plan.append((partition, name, date))
+    logging.info('Backfilling %d partitions from %s to %s.' %
+                 (len(plan), begin.date(), end.date()))
+
+    scheduler = frequency_scheduler(jobs, retries, backoff)
+    output.mkdir(parents=True, exist_ok=True)
+
+    with instrument.stage('backfill', profile=True), provider_session(username, password, tz, mock) as provider:
+        plants_code = provider.plant_codes(query_plants(
+            provider, scheduler, output, end, format))
+
+        def task(partition, name, date):
+            query(output, name, date, format, provider.series, name, plants_code, date)
+            mark_done(partition)
+
+        tasks = {partition: (task, partition, name, date)
+                 for partition, name, date in plan}
+        tasks['alarms'] = (query, output, 'alarms', end, format,
+                           provider.alarms, plants_code, begin, end)
+        outcomes = scheduler.run(tasks)
+        if not outcomes['alarms']['error']:
+            wfile = output / '.alarms.json'
+            watermarks.save(wfile, {**{code: end for code in plants_code}, **watermarks.load(wfile)})
+        raise_failures(outcomes)
+
+    checkpoint_file.unlink()
+
+
+def last_sample(output: Path, date: datetime, tz: pytz.timezone, format: str):
+    '''
+    Gets the timestamp of the latest realtime sample of date partition, or None if there's none.
+    '''
+    dfile = output / std_utils.format_filename('realtime', date, format)
+    try:
+        times = std_utils.from_csv(dfile, columns=['collectTime'], typed=False)[
+            'collectTime']
+    except (FileNotFoundError, pd.errors.EmptyDataError, KeyError):
+        return None
+    if pd.api.types.is_datetime64_dtype(times):  # Typed dates are naive, in plants time zone
+        times = times.dt.tz_localize(tz)
+    else:
+        times = pd.to_datetime(times, utc=True, format='ISO8601')
+    return times.max().timestamp() if len(times) else None
+
+
+def flush(output: Path, samples: list, format: str):
+    '''
+    Writes realtime samples, as dicts of column -> value, to their daily partitions, see write_merged().
+    '''
+    if not samples:
+        return
+    flat = pd.DataFrame(samples)
+    for day, frame in flat.groupby(flat['collectTime'].dt.date):
+        dfile = output / std_utils.format_filename(
+            'realtime', datetime(day.year, day.month, day.day), format)
+        logging.info('Flushing %d realtime samples to %s.' %
+                     (len(frame), dfile))
+        with instrument.stage('flush', 'realtime'):
+            write_merged(frame, dfile, merged_keys()['realtime'])
+        instrument.count('flush', 'realtime', rows=len(frame), files=1)
+
+
+def flush_buffer(output: Path, buffer: RingBuffer, format: str):
+    '''
+    Flushes buffered samples. Samples failing to be written are put back in the buffer, to be flushed
+    next time, the oldest ones being dropped if the buffer is full. Samples dropped since previous flush
+    are reported.
+    '''
+    samples = buffer.drain()
+    try:
+        flush(output, samples, format)
+    except OSError as e:
+        logging.error('Failed to flush %d realtime samples: %s' %
+                      (len(samples), repr(e)))
+        for sample in samples:
+            buffer.append(sample['stationCode'], sample)
+    dropped, buffer.dropped = buffer.dropped, 0
+    if dropped:
+        logging.warning('%d realtime samples dropped from full buffer.' %
+                        dropped)
+
+
+def watch(output: Path, username: str, password: str, tz: pytz.timezone, mock, format: str = 'csv',
+          interval: float = 300., flush_every: int = 12, capacity: int = 288,
+          jobs: int = 3, retries: int = 3, backoff: float = 30., polls: int = None):
+    '''
+    Polls realtime data every 'interval' seconds, until 'polls' polls are done, forever by default.
+    Samples are timed with the beginning of their interval, and buffered in a ring buffer holding up to
+    'capacity' samples per plant. The buffer is flushed to daily partitions every 'flush_every' polls,
+    and when watch stops, next to the samples of daily collection, see write_merged(). Intervals
+    already in today's partition are skipped, so that a restart doesn't duplicate samples.
+    The plants list is refreshed daily. A failing refresh is logged and retried at next poll, previous
+    plants being polled meanwhile.
+    Interval should allow realtime requests (one per 100 plants) within the interface frequency limits,
+    a throttled poll is retried with backoff, then skipped.
+    '''
+    scheduler = frequency_scheduler(jobs, retries, backoff)
+    buffer = RingBuffer(capacity)
+    done, day, plants_code, last = 0, None, [], None
+
+    with instrument.stage('watch'), provider_session(username, password, tz, mock) as provider:
+        try:
+            while polls is None or done < polls:
+                slot = time.time() // interval * interval
+                date = datetime.fromtimestamp(slot, tz)
+                if date.date() != day:
+                    try:
+                        plants_code = provider.plant_codes(query_plants(
+                            provider, scheduler, output, date, format))
+                        day = date.date()
+                    except Exception as e:
+                        if day is None:  # Plants list is required to start
+                            raise
+                        logging.error('Failed to refresh plants list, keeping %d previous plants: %s' %
+                                      (len(plants_code), repr(e)))
+                    last = last_sample(output, date, tz, format)
+
+                if last is not None and slot <= last:
+                    logging.info('Realtime data of %s already collected.' % date)
+                else:
+                    with instrument.stage('poll', 'realtime'):
+                        outcome = scheduler.attempt(
+                            'realtime', provider.series, 'realtime', plants_code, date)
+                    if outcome['result'] is not None:
+                        for sample in outcome['result'].to_dict('records'):
+                            buffer.append(sample['stationCode'], sample)
+                    done += 1
+                    if done % flush_every == 0:
+                        flush_buffer(output, buffer, format)
+
+                if polls is None or done < polls:
+                    time.sleep(max(0., slot + interval - time.time()))
+        finally:
+            flush_buffer(output, buffer, format)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('-u', '--username', required=True,
-                        help='FusionSolar Northbound interface user name')
-    parser.add_argument('-p', '--password', required=True,
-                        help='FusionSolar Northbound interface password')
+    parser.add_argument('-u', '--username', default=None,
+                        help='FusionSolar Northbound interface user name, required unless --mock')
+    parser.add_argument('-p', '--password', default=None,
+                        help='FusionSolar Northbound interface password, required unless --mock')
     parser.add_argument('-o', '--output', default='out',
                         help='Output directory. Example --output your_path, default=out')
     parser.add_argument('-d', '--date', default='',
                         help='Collection date in ISO 8601 format. Example --date 2023-07-17, default to now')
+    parser.add_argument('--from', dest='begin', default='',
+                        help='Backfills history from this date in ISO 8601 format, up to --to date. Example --from 2023-01-01')
+    parser.add_argument('--to', dest='end', default='',
+                        help='Backfill end date in ISO 8601 format, default to now')
+    parser.add_argument('-w', '--watch', default=False, action=argparse.BooleanOptionalAction,
+                        help='Continuously collects realtime data, until interrupted')
+    parser.add_argument('-i', '--interval', type=float, default=300.,
+                        help='Realtime polling interval in seconds, in watch mode, default=300')
+    parser.add_argument('--flush_every', type=int, default=12,
+                        help='Number of polls between two flushes of realtime samples, in watch mode, default=12')
+    parser.add_argument('--buffer', type=int, default=288,
+                        help='Maximum number of buffered realtime samples per plant, in watch mode, default=288')
+    parser.add_argument('--polls', type=int, default=None,
+                        help='Stops watch mode after this number of polls, default to run forever')
+    parser.add_argument('--alarms_overlap', type=float, default=1.,
+                        help='Days of alarms collected again before each plant watermark, to catch late updates, default=1')
     parser.add_argument('-m', '--mock', default=False, action=argparse.BooleanOptionalAction,
                         help='Mock fusion solar data')
+    parser.add_argument('--mock_plants', type=int, default=100,
+                        help='Number of plants of the mock interface, default=100')
+    parser.add_argument('--mock_seed', type=int, default=0,
+                        help='Seed of the mock interface data, default=0')
+    parser.add_argument('--mock_latency', type=float, default=0.,
+                        help='Mock interface mean request latency in seconds, default=0')
+    parser.add_argument('--mock_page_size', type=int, default=100,
+                        help='Mock interface maximum number of plants per plant list page, default=100')
+    parser.add_argument('--mock_frequency_limit', type=float, default=0.,
+                        help='Mock interface probability of a request to fail with frequency limit, default=0')
     parser.add_argument('-t', '--timezone',
                         default='Europe/Paris', help='Timezone')
+    parser.add_argument('-fmt', '--format', default='csv', choices=std_utils.storage_formats(),
+                        help='Raw files storage format, default=csv')
+    parser.add_argument('-j', '--jobs', type=int, default=3,
+                        help='Maximum number of concurrent requests, default=3')
+    parser.add_argument('-r', '--retries', type=int, default=3,
+                        help='Maximum number of retries of a request hitting frequency limit, default=3')
+    parser.add_argument('-b', '--backoff', type=float, default=30.,
+                        help='First retry delay in seconds, doubled for each retry, default=30')
+    parser.add_argument('--report', default=None,
+                        help='Writes stages and api calls metrics to this json file at exit')
+    parser.add_argument('--profile', default=None,
+                        help='Dumps cProfile and tracemalloc statistics of collection to this directory')
     parser.add_argument('-ll', '--loglevel', default='info',
                         help='Logging level. Example --loglevel debug, default=info')
     args = parser.parse_args()
+    if not args.mock and not (args.username and args.password):
+        parser.error('the following arguments are required: -u/--username, -p/--password')
 
     logging.basicConfig(level=args.loglevel.upper())
+    instrument.setup(args.report, args.profile)
 
     date = datetime.fromisoformat(
         args.date) if args.date else datetime.now(tz=timezone.utc)
+    mock = {'plants': args.mock_plants, 'seed': args.mock_seed, 'latency': args.mock_latency,
+            'page_size': args.mock_page_size, 'frequency_limit': args.mock_frequency_limit} if args.mock else False
 
-    collect(output=Path(args.output), username=args.username,
-            password=args.password, date=date, tz=pytz.timezone(args.timezone), mock=args.mock)
+    if args.watch:
+        # Flushes buffered samples when stopped by the system
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        watch(output=Path(args.output), username=args.username, password=args.password,
+              tz=pytz.timezone(args.timezone), mock=mock, format=args.format, interval=args.interval,
+              flush_every=args.flush_every, capacity=args.buffer, jobs=args.jobs, retries=args.retries,
+              backoff=args.backoff, polls=args.polls)
+    elif args.begin:
+        end = datetime.fromisoformat(args.end) if args.end else date
+        backfill(output=Path(args.output), username=args.username, password=args.password,
+                 begin=datetime.fromisoformat(args.begin), end=end, tz=pytz.timezone(args.timezone), mock=mock,
+                 format=args.format, jobs=args.jobs, retries=args.retries, backoff=args.backoff)
+    else:
+        collect(output=Path(args.output), username=args.username,
+                password=args.password, date=date, tz=pytz.timezone(args.timezone), mock=mock,
+                format=args.format, jobs=args.jobs, retries=args.retries, backoff=args.backoff,
+                alarms_overlap=timedelta(days=args.alarms_overlap))
@@ -0,0 +1,130 @@
+import logging
+import argparse
+import pandas as pd
+from pathlib import Path
+from datetime import datetime, timezone
+
+import src.std_utils as std_utils
+import src.instrument as instrument
+
+
+def daily_patterns():
+    '''
+    Gets datasets partitioned per day, see std_utils.format_filename().
+    '''
+    return ['realtime', 'hourly', 'alarms']
+
+
+def partition_day(path: Path):
+    '''
+    Gets the day of a daily partition, or None if it isn't one (ie: a compacted partition).
+    '''
+    try:
+        return datetime.strptime(path.stem.split('_', 1)[1], '%Y-%m-%d')
+    except (IndexError, ValueError):
+        return None
+
+
+def closed_months(source: Path, pattern: str, before: datetime):
+    '''
+    Groups daily partitions of months ended before 'before' date, by compacted partition file.
+    Months whose partitions are stored in several formats are skipped, as they would be compacted into a
+    file per format, of the same partition.
+    '''
+    groups = {}
+    for filename in std_utils.partition_files(source.glob('**/' + pattern + '_*.*')):
+        day = partition_day(filename)
+        if day is None:
+            continue
+        month = day.replace(day=1)
+        end = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+        if end > before:
+            continue
+        compacted = filename.with_name(
+            pattern + '_' + month.strftime('%Y-%m') + filename.suffix)
+        groups.setdefault(compacted, []).append(filename)
+
+    months = {}
+    for compacted in groups:
+        months.setdefault(compacted.with_suffix(''), []).append(compacted)
+    for month, compacted in months.items():
+        existing = filter(std_utils.is_storage_file, month.parent.glob(month.name + '.*'))
+        if len(set(f.suffix for f in compacted + list(existing))) > 1:
+            logging.warning('Partitions of %s are stored in several formats. Skipping compaction.' % month)
+            for c in compacted:
+                del groups[c]
+    return groups
+
+
+def load(filename: Path):
+    '''
+    Loads a partition. csv values are loaded as text, so that they are written back unchanged.
+    '''
+    if filename.suffix == '.csv':
+        return pd.read_csv(filename, dtype=str, keep_default_na=False)
+    return std_utils.from_csv(filename)
+
+
+def compact_month(compacted: Path, filenames: list):
+    '''
+    Concatenates daily partitions, in loading order, after the existing compacted partition if any.
+    Entries duplicated across files, as left by an interrupted compaction, are only kept once at their
+    last position, which doesn't change loaded data as latest entries win. Daily partitions are removed once compacted file is written.
+    '''
+    filenames = sorted(filenames, key=std_utils.partition_key)
+    frames = []
+    for filename in ([compacted] if compacted.exists() else []) + filenames:
+        try:
+            frames.append(load(filename))
+        except pd.errors.EmptyDataError:
+            logging.debug('Skipping empty file %s.' % filename)
+    if frames:
+        data = pd.concat(frames, ignore_index=True)
+        if compacted.suffix == '.csv':  # Columns missing from some files
+            data.fillna('', inplace=True)
+        data = data[~data.duplicated(keep='last')]
+        logging.info('Compacting %d files into %s (%d entries).' %
+                     (len(filenames), compacted, len(data)))
+        std_utils.to_csv(data, compacted)
+        instrument.count('compact', std_utils.dataset(compacted), rows=len(data),
+                         bytes=compacted.stat().st_size, files=1)
+    for filename in filenames:
+        filename.unlink()
+
+
+def compact(source: Path, before: datetime):
+    '''
+    Rewrites daily partitions of closed months into monthly partitions, ie: 2023/hourly_2023-07-*.csv into
+    2023/hourly_2023-07.csv. A month is closed if it ended before 'before' date.
+    Compacted partitions are loaded before daily ones (see std_utils.partition_key()), so that a partition
+    written after compaction still wins. Running compaction again merges such late partitions.
+    Compaction applies to a tree of a single layer, raw or std. As std files are standardized from raw
+    ones with the same name, both layers should be compacted.
+    '''
+    for pattern in daily_patterns():
+        with instrument.stage('compact', pattern):
+            for compacted, filenames in sorted(closed_months(source, pattern, before).items()):
+                compact_month(compacted, filenames)
+
+
+if __name__ == '__main__':
+    '''
+    Compacts daily partitions into monthly ones.
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--source', required=True,
+                        help='Partitions directory, raw or std')
+    parser.add_argument('-d', '--date', default='',
+                        help='Compacts months ended before this date in ISO 8601 format. Example --date 2023-08-01, default to now')
+    parser.add_argument('--report', default=None,
+                        help='Writes stages metrics to this json file at exit')
+    parser.add_argument('-ll', '--loglevel', default='info',
+                        help='Logging level. Example --loglevel debug, default=info')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.loglevel.upper())
+    instrument.setup(args.report)
+
+    date = datetime.fromisoformat(
+        args.date) if args.date else datetime.now(tz=timezone.utc)
+    compact(Path(args.source), date.replace(tzinfo=None))
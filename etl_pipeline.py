@@ -0,0 +1,114 @@
+import sys
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+import pytz
+
+import src.std_utils as std_utils
+import src.instrument as instrument
+import etl_collect_fus
+import etl_standardize
+import etl_aggregate
+
+
+def pipeline(output: Path, username: str, password: str, date: datetime, tz: pytz.timezone, mock, config: Path,
+             provider: str = 'fusion_solar', format: str = 'csv', rollup: bool = True,
+             jobs: int = 3, retries: int = 3, backoff: float = 30., alarms_overlap: timedelta = timedelta(days=1)):
+    '''
+    Collects, standardizes and aggregates a day of data in a single process. Datasets are passed in
+    memory from a stage to the next one, each layer files being written once as side outputs:
+    output/raw/<provider>, output/std/<provider> and output/agg, as separate entry points do.
+    Realtime partition holds the samples collected before during the day (ie: by watch mode), which are
+    standardized with the fresh ones, see etl_collect_fus.write_merged().
+    Fresh partitions are merged into existing aggregated files, which only requires output/agg to hold
+    previous aggregated files and their manifest, see etl_aggregate.aggregate_fresh().
+    Returns the list of datasets whose aggregated file couldn't be updated.
+    '''
+    raw = output / 'raw' / provider
+    std = output / 'std' / provider
+    agg = output / 'agg'
+    for path in [raw, std, agg]:
+        path.mkdir(parents=True, exist_ok=True)
+
+    collected = etl_collect_fus.collect(raw, username, password, date, tz, mock, format,
+                                        jobs, retries, backoff, alarms_overlap)
+
+    plan = etl_standardize.load_plan(config)
+    fresh = {}
+    with instrument.stage('standardize', profile=True):
+        for name, data in collected.items():
+            if data.empty:
+                logging.info('Empty %s data. Skipping update.' % name)
+                continue
+            dfile = std / std_utils.format_filename(name, date, format)
+            logging.info('Outputting file: %s' % dfile)
+            fresh[dfile] = etl_standardize.standardize_frame(name, data, plan)
+            std_utils.to_csv(fresh[dfile], dfile)
+            instrument.count('standardize', name, rows=len(fresh[dfile]),
+                             bytes=dfile.stat().st_size, files=1)
+
+    stale = etl_aggregate.aggregate_fresh(output / 'std', agg, fresh, format)
+    if rollup:
+        with instrument.stage('rollup', profile=True):
+            etl_aggregate.rollup(agg, format)
+    return stale
+
+
+if __name__ == '__main__':
+    '''
+    Runs collect, standardize and aggregate stages in a single process.
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-u', '--username', default=None,
+                        help='FusionSolar Northbound interface user name, required unless --mock')
+    parser.add_argument('-p', '--password', default=None,
+                        help='FusionSolar Northbound interface password, required unless --mock')
+    parser.add_argument('-o', '--output', default='data',
+                        help='Data root directory, holding raw, std and agg layers. Example --output your_path, default=data')
+    parser.add_argument('-c', '--config', default='src/fus2std.json',
+                        help='Column renaming configuration json file, default=src/fus2std.json')
+    parser.add_argument('-d', '--date', default='',
+                        help='Collection date in ISO 8601 format. Example --date 2023-07-17, default to now')
+    parser.add_argument('-m', '--mock', default=False, action=argparse.BooleanOptionalAction,
+                        help='Mock fusion solar data')
+    parser.add_argument('--mock_plants', type=int, default=100,
+                        help='Number of plants of the mock interface, default=100')
+    parser.add_argument('-t', '--timezone',
+                        default='Europe/Paris', help='Timezone')
+    parser.add_argument('-fmt', '--format', default='csv', choices=std_utils.storage_formats(),
+                        help='Files storage format, default=csv')
+    parser.add_argument('-r', '--rollup', default=True, action=argparse.BooleanOptionalAction,
+                        help='Materializes dashboards summary tables from aggregated files')
+    parser.add_argument('-j', '--jobs', type=int, default=3,
+                        help='Maximum number of concurrent requests, default=3')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='Maximum number of retries of a request hitting frequency limit, default=3')
+    parser.add_argument('-b', '--backoff', type=float, default=30.,
+                        help='First retry delay in seconds, doubled for each retry, default=30')
+    parser.add_argument('--alarms_overlap', type=float, default=1.,
+                        help='Days of alarms collected again before each plant watermark, to catch late updates, default=1')
+    parser.add_argument('--report', default=None,
+                        help='Writes stages and api calls metrics to this json file at exit')
+    parser.add_argument('--profile', default=None,
+                        help='Dumps cProfile and tracemalloc statistics of hot stages to this directory')
+    parser.add_argument('-ll', '--loglevel', default='info',
+                        help='Logging level. Example --loglevel debug, default=info')
+    args = parser.parse_args()
+    if not args.mock and not (args.username and args.password):
+        parser.error('the following arguments are required: -u/--username, -p/--password')
+
+    logging.basicConfig(level=args.loglevel.upper())
+    instrument.setup(args.report, args.profile)
+
+    date = datetime.fromisoformat(
+        args.date) if args.date else datetime.now(tz=timezone.utc)
+    mock = {'plants': args.mock_plants} if args.mock else False
+
+    stale = pipeline(Path(args.output), args.username, args.password, date, pytz.timezone(args.timezone), mock,
+                     Path(args.config), format=args.format, rollup=args.rollup,
+                     jobs=args.jobs, retries=args.retries, backoff=args.backoff,
+                     alarms_overlap=timedelta(days=args.alarms_overlap))
+    if stale:
+        sys.exit('Aggregated %s files are not updated. Download std layer and run etl_aggregate.py --full to rebuild them.' %
+                 ', '.join(stale))
@@ -4,46 +4,133 @@ import logging
 import argparse
 import glob
 import json
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import src.std_utils as std_utils
+import src.instrument as instrument
+from src.providers import providers
 
 
-def standardize(source: Path, destination: Path, config: Path):
+def compile_config(rdict: dict):
+    '''
+    Compiles remapping configuration into a column plan, mapping each source column to its
+    standard name and values map (or None). Numeric keys of values maps are parsed once here, and
+    kept as strings too, as in memory data may not have been parsed from csv.
+    '''
+    values = {col: {**mapping, **{int(k): v for k, v in mapping.items() if k.isdigit()}}
+              for col, mapping in rdict['values'].items()}
+    return {scol: (dcol, values.get(dcol)) for scol, dcol in rdict['columns'].items()}
+
+
+def remap_values(data: pd.Series, mapping: dict):
+    '''
+    Remaps series values with a dict, keeping unmapped ones.
+    Values are factorized so mapping is only applied to distinct values, then expanded back from codes.
+    '''
+    codes, uniques = pd.factorize(data)
+    if not any(u in mapping for u in uniques):
+        return data
+    # Missing values have code -1, which selects the trailing nan
+    mapped = np.array([mapping.get(u, u) for u in uniques] + [np.nan], dtype=object)
+    return pd.Series(mapped[codes], index=data.index, name=data.name)
+
+
+def remap(sdata: pd.DataFrame, plan: dict):
+    '''
+    Selects, renames and remaps columns according to plan, in a single pass per column.
+    '''
+    columns = [c for c in sdata.columns if c in plan]
+    if not columns:
+        return sdata[[]]
+    return pd.concat([(sdata[c] if plan[c][1] is None else remap_values(sdata[c], plan[c][1])).rename(plan[c][0])
+                      for c in columns], axis=1)
+
+
+def standardize_file(sfile: Path, dfile: Path, plan: dict):
+    '''
+    Standardizes a single file, returns False if it has no data.
+    '''
+    logging.info('Processing latest file: %s' % sfile)
+    name = std_utils.dataset(sfile)
+    try:
+        with instrument.stage('read', name):
+            sdata = std_utils.from_csv(sfile, typed=False)
+    except pd.errors.EmptyDataError:
+        logging.info(
+            'Empty data for latest file: %s. Skipping update.' % sfile)
+        return False
+    logging.info('Outputting file: %s' % dfile)
+    with instrument.stage('write', name):
+        std_utils.to_csv(remap(sdata, plan), dfile)
+    instrument.count('standardize', name, rows=len(sdata),
+                     bytes=dfile.stat().st_size, files=1)
+    return True
+
+
+def is_up_to_date(sfile: Path, dfile: Path, config_mtime: float):
+    '''
+    Destination file is up to date if it's newer than both source file and configuration.
+    '''
+    return dfile.exists() and dfile.stat().st_mtime > max(sfile.stat().st_mtime, config_mtime)
+
+
+def load_plan(config: Path):
+    '''
+    Loads and compiles remapping configuration json file, see compile_config().
+    '''
     try:
         with open(config) as f:
             rdict = json.load(f)
     except:
         logging.fatal(
-            'Failed to decode json remaping configuration: %' % config)
+            'Failed to decode json remaping configuration: %s' % config)
         raise
-    else:
-        for sfile in source.glob('**/*.csv'):
-            logging.info('Processing latest file: %s' % sfile)
-            try:
-                sdata = std_utils.from_csv(sfile)
-            except pd.errors.EmptyDataError:
-                logging.info(
-                    'Empty data for latest file: %s. Skipping update.' % sfile)
-                pass
-            else:
-                # Select columns
-                ddata = sdata[[
-                    c for c in sdata.columns if c in rdict['columns'].keys()]]
-                ddata = ddata.rename(columns=rdict['columns'])
-
-                # Remap values
-                for col, dict in rdict['values'].items():
-                    if col in ddata:
-                        dict = {int(k) if k.isdigit() else k: v for k,
-                                v in dict.items()}
-                        ddata = ddata.replace({col: dict})
-
-                dfile = destination / sfile.relative_to(source)
-                logging.info('Outputting file: %s' % dfile)
-                std_utils.to_csv(ddata, dfile)
+    return compile_config(rdict)
+
+
+def standardize_frame(name: str, sdata: pd.DataFrame, plan: dict):
+    '''
+    Standardizes an in memory dataset, typed as if it was loaded from its standardized file.
+    '''
+    return std_utils.conform(remap(sdata, plan), name)
+
+
+def standardize(source: Path, destination: Path, config: Path, format: str = 'csv',
+                full: bool = False, workers: int = None, processes: bool = False):
+    plan = load_plan(config)
+    config_mtime = config.stat().st_mtime
+
+    files = {}
+    for sfile in filter(std_utils.is_storage_file, source.glob('**/*.*')):
+        dfile = destination / \
+            sfile.relative_to(source).with_suffix('.' + format)
+        if not full and is_up_to_date(sfile, dfile, config_mtime):
+            logging.debug('Skipping up to date file: %s' % dfile)
+        else:
+            files[sfile] = dfile
+    logging.info('Standardizing %d files.' % len(files))
+
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with instrument.stage('standardize', profile=True), executor(max_workers=workers) as pool:
+        list(pool.map(standardize_file, files.keys(),
+             files.values(), [plan] * len(files)))
+
+
+def standardize_providers(source: Path, destination: Path, format: str = 'csv',
+                          full: bool = False, workers: int = None, processes: bool = False):
+    '''
+    Standardizes each provider raw tree source/<provider> to destination/<provider>, with the provider
+    configuration file.
+    '''
+    for name, provider in providers().items():
+        if (source / name).is_dir():
+            logging.info('Standardizing %s provider data.' % name)
+            standardize(source / name, destination / name, provider.config,
+                        format, full, workers, processes)
 
 
 if __name__ == '__main__':
@@ -55,12 +142,30 @@ if __name__ == '__main__':
                         help='Source directory')
     parser.add_argument('-d', '--destination', required=True,
                         help='Destination directory')
-    parser.add_argument('-c', '--config', required=True,
-                        help='Column renaming configuration json file')
+    parser.add_argument('-c', '--config', default=None,
+                        help='Column renaming configuration json file. If omitted, source and destination are roots of per provider trees, standardized with each provider configuration')
+    parser.add_argument('-fmt', '--format', default='csv', choices=std_utils.storage_formats(),
+                        help='Standardized files storage format, default=csv')
+    parser.add_argument('-f', '--full', default=False, action=argparse.BooleanOptionalAction,
+                        help='Standardizes all files, including up to date ones')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of concurrent workers, default to executor default')
+    parser.add_argument('-p', '--processes', default=False, action=argparse.BooleanOptionalAction,
+                        help='Processes files on a process pool instead of a thread pool')
+    parser.add_argument('--report', default=None,
+                        help='Writes stages metrics to this json file at exit')
+    parser.add_argument('--profile', default=None,
+                        help='Dumps cProfile and tracemalloc statistics of standardization to this directory')
     parser.add_argument('-ll', '--loglevel', default='info',
                         help='Logging level. Example --loglevel debug, default=info')
     args = parser.parse_args()
 
     logging.basicConfig(level=args.loglevel.upper())
+    instrument.setup(args.report, args.profile)
 
-    standardize(Path(args.source), Path(args.destination), Path(args.config))
+    if args.config:
+        standardize(Path(args.source), Path(args.destination),
+                    Path(args.config), args.format, args.full, args.jobs, args.processes)
+    else:
+        standardize_providers(Path(args.source), Path(args.destination),
+                              args.format, args.full, args.jobs, args.processes)
@@ -13,11 +13,11 @@ root = Path('data/')
 to_drop = ['perpower_ratio', 'installed_capacity']
 
 for pattern in std_utils.file_patterns():
-    search_pattern = '**/' + pattern + '*.csv'
+    search_pattern = '**/' + pattern + '*.*'
 
     logging.info('Processing files with pattern: %s.' % search_pattern)
 
-    for filename in root.glob(search_pattern):
+    for filename in filter(std_utils.is_storage_file, root.glob(search_pattern)):
         logging.info('Processing file: %s.' % filename)
 
         try:
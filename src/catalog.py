@@ -0,0 +1,149 @@
+from pathlib import Path
+import logging
+import shutil
+import pandas as pd
+
+import src.std_utils as std_utils
+import src.manifest as manifest
+
+
+class Catalog:
+    '''
+    Aggregated datasets, each one loaded on first access and joined with plants attributes.
+    Loaded datasets can be cached on disk, keyed by source files fingerprints, so that unchanged
+    data isn't parsed again between runs.
+    catalog['hourly'] behaves like a dict: the same dataframe is returned by each access, and
+    entries can be set. Derived columns are computed on first access too, see derive().
+    '''
+
+    def __init__(self, path: Path, format: str = 'csv', plants_columns: list = ['plant_name'], cache: Path = None):
+        '''
+        path is the aggregated files directory, format their storage format.
+        plants_columns are the plants attributes joined to datasets.
+        cache is the disk cache directory, disabled if None.
+        '''
+        self.path = Path(path)
+        self.format = format
+        self.plants_columns = plants_columns
+        self.cache = Path(cache) if cache else None
+        self.datasets = {}
+        self.derived = {}
+
+    def __getitem__(self, name: str):
+        if name not in self.datasets:
+            data = self.load(name)
+            for column, (func, names) in self.derived.items():
+                if name in names:
+                    data[column] = func(self, data)
+            self.datasets[name] = data
+        return self.datasets[name]
+
+    def __setitem__(self, name: str, value):
+        self.datasets[name] = value
+
+    def derive(self, column: str, func, names: list):
+        '''
+        Declares a column of the datasets in names, computed by func(catalog, data) once a dataset is
+        accessed, so that datasets aren't loaded to compute it. Already accessed datasets get it now.
+        '''
+        self.derived[column] = (func, names)
+        for name in names:
+            if name in self.datasets:
+                self.datasets[name][column] = func(self, self.datasets[name])
+
+    def sources(self, name: str):
+        '''
+        Gets dataset source files.
+        '''
+        return sorted(self.path.glob('**/' + name + '.' + self.format))
+
+    def load(self, name: str, begin=None, end=None, columns: list = None):
+        '''
+        Loads a dataset, restricted to [begin, end] time range and to a subset of columns if specified.
+        Plants attributes are joined to all datasets but plants, unless dataset already has them.
+        '''
+        time = next((col for col, kind in std_utils.schemas().get(name, {}).items()
+                     if kind == 'datetime64[ns]'), None)
+        if columns is not None:
+            # Keeps columns needed to join and filter
+            columns = list(dict.fromkeys(
+                ['plant_code'] + ([time] if time else []) + columns))
+
+        data = self.read(name, columns, time, begin, end)
+        attributes = [c for c in self.plants_columns if c not in data]
+        if name == 'plants' or not attributes or data.empty:
+            return data
+        plants = self.read('plants', ['plant_code'] + attributes)
+        return pd.merge(data, plants, on=['plant_code'])
+
+    def read(self, name: str, columns: list = None, time: str = None, begin=None, end=None):
+        '''
+        Reads a dataset, from disk cache if it's still valid, restricted to a subset of columns and to
+        the [begin, end] range of its time column if specified.
+        Without cache, source files are loaded with the requested columns only, and restricted to the
+        range before they're merged. Cache holds all columns, each one in its own file, so that it
+        serves any columns subset without loading the others.
+        '''
+        sources = self.sources(name)
+        keys = std_utils.primary_keys().get(name)
+        if self.cache is None:
+            frames = std_utils.read_csvs(sources, columns=columns)
+            for index, frame in enumerate(frames):
+                frames[index] = in_range(frame, time, begin, end)
+            return std_utils.merge(frames, keys)
+
+        cached = self.cache / name
+        manifest_file = self.cache / 'manifest.json'
+        manifests = manifest.load(manifest_file)
+        known = manifests.get(name, {})
+        names = {str(f.relative_to(self.path)): f for f in sources}
+        if (cached / 'columns.pkl').exists() and known.keys() == names.keys() and all(
+                manifest.unchanged(f, known[n]) for n, f in names.items()):
+            logging.debug('Loading %s from cache.' % name)
+            data = load_columns(cached, columns)
+        else:
+            logging.info('Loading %s from %d files.' % (name, len(sources)))
+            data = std_utils.merge(std_utils.read_csvs(sources), keys)
+            save_columns(data, cached)
+            manifests[name] = {n: manifest.fingerprint(f)
+                               for n, f in names.items()}
+            manifest.save(manifests, manifest_file)
+            if columns is not None:
+                data = data[[c for c in data.columns if c in columns]]
+        return in_range(data, time, begin, end)
+
+
+def in_range(data: pd.DataFrame, time: str, begin=None, end=None):
+    '''
+    Restricts data to the [begin, end] range of its time column, bounds being optional.
+    '''
+    if time is None or time not in data:
+        return data
+    if begin is not None:
+        data = data.loc[data[time] >= begin]
+    if end is not None:
+        data = data.loc[data[time] <= end]
+    return data
+
+
+def save_columns(data: pd.DataFrame, path: Path):
+    '''
+    Pickles a dataframe to a directory, one file per column, so that columns can be loaded separately.
+    Pickle rather than parquet, because some object columns (ie: partially remapped device types) mix
+    numbers and strings.
+    '''
+    shutil.rmtree(path, ignore_errors=True)
+    path.mkdir(parents=True)
+    pd.to_pickle(data.index, path / 'index.pkl')
+    for position, col in enumerate(data.columns):
+        pd.to_pickle(data[col].array, path / ('%d.pkl' % position))
+    pd.to_pickle(list(data.columns), path / 'columns.pkl')
+
+
+def load_columns(path: Path, columns: list = None):
+    '''
+    Loads a dataframe pickled by save_columns(), only with the columns listed in 'columns' if specified.
+    '''
+    return pd.DataFrame({col: pd.read_pickle(path / ('%d.pkl' % position))
+                         for position, col in enumerate(pd.read_pickle(path / 'columns.pkl'))
+                         if columns is None or col in columns}, index=pd.read_pickle(path / 'index.pkl'))
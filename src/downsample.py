@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+
+def methods():
+    '''
+    Gets downsampling methods:
+    - minmax keeps the minimum and maximum of each time bucket, so all peaks are kept exactly.
+    - lttb (Largest Triangle Three Buckets) keeps the points that best preserve the series shape.
+    '''
+    return {'minmax': minmax, 'lttb': lttb}
+
+
+def numeric(x):
+    '''
+    Converts x values to floats, dates being converted to nanoseconds.
+    '''
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype('int64').astype('float64')
+    return x.astype('float64')
+
+
+def minmax(x, y, points: int):
+    '''
+    Gets indices of the points to keep to reduce (x, y) series to about 'points' points, x being sorted.
+    x range is split in equal width buckets, keeping first and last points, and the minimum and maximum
+    of each bucket.
+    '''
+    n = len(y)
+    if n <= points:
+        return np.arange(n)
+    x = numeric(x)
+    buckets = max(1, (points - 2) // 2)
+    bucket = np.minimum(((x - x[0]) / max(x[-1] - x[0], 1.) * buckets).astype('int64'),
+                        buckets - 1)
+    grouped = pd.Series(np.asarray(y, dtype='float64')).groupby(bucket)
+    keep = np.concatenate([[0, n - 1], grouped.idxmin().dropna().values,
+                           grouped.idxmax().dropna().values]).astype('int64')
+    return np.unique(keep)
+
+
+def lttb(x, y, points: int):
+    '''
+    Gets indices of the points to keep to reduce (x, y) series to 'points' points with Largest Triangle
+    Three Buckets, x being sorted. Missing values are considered null.
+    '''
+    n = len(y)
+    if n <= points:
+        return np.arange(n)
+    if points < 3:
+        return np.array([0, n - 1])[:points]
+    x = numeric(x)
+    y = np.nan_to_num(np.asarray(y, dtype='float64'))
+    # Buckets of equal size, excluding first and last points which are always kept
+    edges = np.linspace(1, n - 1, points - 1).astype('int64')
+    keep = np.empty(points, dtype='int64')
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        begin, end = edges[i], edges[i + 1]
+        # Next bucket average point, last point for the last bucket
+        following = slice(end, edges[i + 2]) if i + 2 < len(edges) else slice(n - 1, n)
+        cx, cy = x[following].mean(), y[following].mean()
+        area = np.abs((x[a] - cx) * (y[begin:end] - y[a]) -
+                      (x[a] - x[begin:end]) * (cy - y[a]))
+        a = begin + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(data: pd.DataFrame, x: str, y: str, points: int = 2000, by: str = None, method: str = 'minmax'):
+    '''
+    Reduces time series to about 'points' points, keeping whole rows so that other columns can still be
+    plotted (hover data...).
+    If by is specified (ie: 'plant_name'), each series is downsampled separately to 'points' points, as
+    drawn by line charts. Otherwise all series values are summed by x and the selected x values are kept
+    for all series, so that stacked charts (bars, areas) stay aligned, with the peaks of their total.
+    '''
+    select = methods()[method]
+    data = data.sort_values(x, kind='stable')
+    if by is None:
+        total = data.groupby(x, observed=True)[y].sum()
+        kept = total.index[select(total.index.values, total.values, points)]
+        return data[data[x].isin(kept)]
+    return pd.concat([group.iloc[select(group[x].values, group[y].values, points)]
+                      for _, group in data.groupby(by, observed=True)] or [data])
+
+
+def view(data: pd.DataFrame, x: str, y: str, begin=None, end=None, points: int = 2000, by: str = None,
+         method: str = 'minmax'):
+    '''
+    Gets data to chart over a visible [begin, end] x range, downsampled to the chart resolution: short
+    ranges are drawn at full resolution, long ones are reduced to 'points' points, see downsample().
+    '''
+    if begin is not None:
+        data = data.loc[data[x] >= begin]
+    if end is not None:
+        data = data.loc[data[x] <= end]
+    return downsample(data, x, y, points, by, method)
@@ -0,0 +1,285 @@
+'''
+External sort and merge of dataset partitions, within a memory budget.
+Partitions are loaded by chunks and typed as std_utils.merge() does. Chunks are accumulated into runs
+that fit the budget, each run being deduplicated, sorted and spilled to disk. Runs are then k-way merged
+by blocks, writing the output incrementally, so that memory doesn't depend on the dataset size.
+Entries are numbered in loading order, so that latest entries win and ties keep loading order, as with
+the in memory path.
+'''
+from pathlib import Path
+import os
+import pickle
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+
+import src.std_utils as std_utils
+
+# Loading order column
+_seq = '__seq'
+# Maximum number of runs merged at once, more runs are merged in several passes
+_fanin = 16
+# Number of cells pandas.DataFrame.to_csv() formats at once, see write_csv()
+_csv_cells = 100000
+
+
+def sortable(data: pd.Series):
+    '''
+    Categories are sorted by value, as merged categories are sorted, see std_utils.merge().
+    '''
+    return data.astype(object) if isinstance(data.dtype, pd.CategoricalDtype) else data
+
+
+def normalize(chunk: pd.DataFrame, columns: list):
+    '''
+    Types a chunk as std_utils.merge() types merged data: all columns are present, and missing values
+    are filled with 0 but for categories.
+    '''
+    chunk = std_utils.typify(chunk.reindex(columns=columns))
+    for col in chunk.select_dtypes('category'):
+        if chunk[col].isna().any():
+            chunk[col] = chunk[col].astype(object)
+    chunk.fillna({col: 0 for col in chunk.select_dtypes(
+        exclude='category')}, inplace=True)
+    return std_utils.typify(chunk)
+
+
+def deduplicated(frames: list, by: list, keys: list):
+    '''
+    Concatenates frames, keeping the latest entry of each key (or of each duplicated row if keys is None),
+    sorted by 'by' columns then loading order. frames list is emptied, so that entries are only in memory
+    once concatenated.
+    '''
+    data = pd.concat(frames, ignore_index=True)
+    frames.clear()
+    if not data[_seq].is_monotonic_increasing:
+        data = data.sort_values(_seq, kind='stable', ignore_index=True)
+    subset = keys if keys is not None else [c for c in data if c != _seq]
+    data = data[~data.duplicated(subset=subset, keep='last')]
+    order = pd.DataFrame({i: sortable(data[col]).values for i, col in enumerate(by)})
+    order[len(by)] = data[_seq].values
+    return data.iloc[order.sort_values(list(order.columns), kind='stable').index].reset_index(drop=True)
+
+
+def write_run(batches, path: Path, rows: int):
+    '''
+    Spills sorted batches to a run file, by blocks of 'rows' rows.
+    '''
+    with open(path, 'wb') as f:
+        for data in batches:
+            for begin in range(0, len(data), rows):
+                pickle.dump(data.iloc[begin:begin + rows],
+                            f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def read_run(path: Path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def last(data: pd.DataFrame, by: list):
+    return tuple(sortable(data[col]).iloc[-1] for col in by)
+
+
+def precedes(data: pd.DataFrame, by: list, bound: tuple):
+    '''
+    Gets the mask of entries whose 'by' columns come strictly before bound.
+    '''
+    less = np.zeros(len(data), dtype=bool)
+    equal = np.ones(len(data), dtype=bool)
+    for col, value in zip(by, bound):
+        values = sortable(data[col])
+        less |= equal & (values < value).values
+        equal &= (values == value).values
+    return less
+
+
+def merge_runs(runs: list, by: list, keys: list):
+    '''
+    K-way merges sorted runs, yielding sorted and deduplicated batches.
+    Runs are read by blocks. All entries coming before the smallest last entry of runs that aren't
+    completely read are in memory, so they are merged and yielded. As duplicated entries share their
+    'by' columns, they are always merged in the same batch.
+    '''
+    readers = [read_run(run) for run in runs]
+    buffers = [pd.DataFrame() for _ in runs]
+    exhausted = [False] * len(runs)
+
+    def refill(i):
+        block = next(readers[i], None)
+        if block is None:
+            exhausted[i] = True
+        else:
+            buffers[i] = pd.concat([buffers[i], block], ignore_index=True) if len(
+                buffers[i]) else block.reset_index(drop=True)
+
+    for i in range(len(runs)):
+        refill(i)
+    while True:
+        reading = [i for i in range(len(runs)) if not exhausted[i]]
+        if not reading:
+            remaining = [buffer for buffer in buffers if len(buffer)]
+            buffers.clear()
+            if remaining:
+                yield deduplicated(remaining, by, keys)
+            return
+
+        bounding = min(reading, key=lambda i: last(buffers[i], by))
+        bound = last(buffers[bounding], by)
+        batch = []
+        for i, buffer in enumerate(buffers):
+            if len(buffer):
+                before = precedes(buffer, by, bound)
+                if before.any():
+                    batch.append(buffer[before])
+                    buffers[i] = buffer[~before].reset_index(drop=True)
+        if batch:
+            yield deduplicated(batch, by, keys)
+        else:  # Bounding run buffer only holds bound entries
+            refill(bounding)
+        for i in reading:
+            if not exhausted[i] and not len(buffers[i]):
+                refill(i)
+
+
+def precision(data: pd.Series):
+    '''
+    Gets the number of fractional digits of seconds pandas writes dates with: 0 if all dates fall on
+    whole seconds, 3, 6 or 9 as soon as one of them has milliseconds, microseconds or nanoseconds.
+    -1 if all dates fall at midnight, as they are then written without time.
+    '''
+    times = data.dropna().values.astype('datetime64[ns]').astype('int64')
+    for digits, unit in [(9, 1), (6, 10**3), (3, 10**6), (0, 10**9)]:
+        if (times % (unit * 1000 if digits else 86400 * 10**9)).any():
+            return digits
+    return -1
+
+
+def formatted(data: pd.Series, digits: int):
+    '''
+    Formats dates with 'digits' fractional digits of seconds, see precision().
+    '''
+    if digits < 0:
+        return data.dt.strftime('%Y-%m-%d')
+    text = data.dt.strftime('%Y-%m-%d %H:%M:%S')
+    if digits:
+        fraction = data.dt.microsecond.fillna(0).astype('int64') * 1000 + \
+            data.dt.nanosecond.fillna(0).astype('int64')
+        text = text + '.' + fraction.astype(str).str.zfill(9).str[:digits]
+    return text
+
+
+def write_csv(batches, path: Path, dtypes: dict, rows: int):
+    '''
+    Writes batches to a csv file, atomically, by blocks of 'rows' rows. Columns are casted to the types
+    they would have once all batches concatenated.
+    pandas.DataFrame.to_csv() formats the dates of each block of _csv_cells cells with the precision they
+    require, so batches are buffered by such blocks to format their dates the same way, see precision().
+    Returns the number of written entries, the file isn't written if there's none.
+    '''
+    tmp = path.with_name(path.name + '.tmp')
+    written = 0
+    pending, count, size = [], 0, None
+    with open(tmp, 'w', newline='') as f:
+        def write():
+            nonlocal written
+            dates = {col: max(precision(data[col]) for data in pending)
+                     for col in pending[0].select_dtypes('datetime')}
+            for data in pending:
+                for begin in range(0, len(data), rows):
+                    block = data.iloc[begin:begin + rows]
+                    block.assign(**{col: formatted(block[col], digits) for col, digits in dates.items()}).to_csv(
+                        f, index=False, header=not written)
+                    written += len(block)
+            pending.clear()
+
+        for batch in batches:
+            batch = batch.drop(columns=_seq)
+            for col, dtype in dtypes.items():
+                if batch[col].dtype != dtype:
+                    batch[col] = batch[col].astype(dtype)
+            size = size or max(1, _csv_cells // len(batch.columns))
+            while count + len(batch) >= size:
+                pending.append(batch.iloc[:size - count])
+                batch = batch.iloc[size - count:]
+                write()
+                count = 0
+            if len(batch):
+                pending.append(batch)
+                count += len(batch)
+        if pending:
+            write()
+    if written:
+        os.replace(tmp, path)
+    else:
+        tmp.unlink()
+    return written
+
+
+def sort_merge(filenames: list, destination: Path, by: list, keys: list, memory: int, workdir: Path = None):
+    '''
+    Merges partitions files, loaded in list order, into a csv destination file sorted by 'by' columns,
+    as std_utils.merge() then sorting would, within about 'memory' bytes.
+    keys are the dataset primary keys, entries are deduplicated by keys only if all files have them.
+    Runs are spilled to a temporary directory in workdir, default to system one.
+    Returns the number of written entries.
+    '''
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    headers = [std_utils.file_columns(filename) for filename in filenames]
+    columns = list(dict.fromkeys(col for header in headers for col in header))
+    if keys is not None and not all(key in header for header in headers for key in keys):
+        keys = None
+
+    # A run and its sorted copy fit in memory, as merged runs blocks do
+    run_bytes = memory // 3
+    block_bytes = memory // (2 * (_fanin + 1))
+    rows = 10000
+    runs, pending, pending_bytes, seq = [], [], 0, 0
+    types = None
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        def spill():
+            run = deduplicated(pending, by, keys)
+            runs.append(write_run([run], Path(tmp) / ('%d.run' % len(runs)), rows))
+            logging.debug('Spilled run of %d entries.' % len(run))
+
+        for filename in filenames:
+            for chunk in std_utils.read_chunks(filename, rows):
+                chunk = normalize(chunk, columns)
+                chunk[_seq] = np.arange(seq, seq + len(chunk))
+                seq += len(chunk)
+
+                # Keeps track of concatenated types
+                plain = chunk.select_dtypes(exclude=['category', 'datetime'])
+                types = plain.iloc[:1] if types is None else pd.concat(
+                    [types, plain.iloc[:1]]).iloc[:1]
+
+                size = chunk.memory_usage(deep=True).sum()
+                rows = max(100, int(block_bytes * len(chunk) / max(size, 1)))
+                pending.append(chunk)
+                pending_bytes += size
+                if pending_bytes >= run_bytes:
+                    spill()
+                    pending_bytes = 0
+        if pending:
+            spill()
+        logging.info('Merging %d entries from %d runs.' % (seq, len(runs)))
+
+        while len(runs) > _fanin:
+            merged = []
+            for begin in range(0, len(runs), _fanin):
+                group = runs[begin:begin + _fanin]
+                merged.append(write_run(merge_runs(group, by, keys),
+                                        Path(tmp) / ('%d.merged' % (begin // _fanin)), rows))
+                for run in group:
+                    run.unlink()
+            runs = merged
+
+        dtypes = {} if types is None else {
+            col: dtype for col, dtype in types.dtypes.items() if col != _seq}
+        return write_csv(merge_runs(runs, by, keys), destination, dtypes, rows)
@@ -1,16 +1,45 @@
 from oauth2client.service_account import ServiceAccountCredentials
 from pydrive.drive import GoogleDrive
-from pydrive.auth import GoogleAuth
+from pydrive.auth import GoogleAuth, LoadAuth
+from pydrive.files import GoogleDriveFile, ApiRequestError
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload
 from pathlib import Path, PurePath
-import asyncio
+from datetime import datetime
+import tempfile
 import argparse
 import logging
 import base64
+import shutil
+import gzip
 import json
+import time
+import sys
+import os
+
+import src.manifest as manifest
+import src.instrument as instrument
+from src.scheduler import Scheduler, failures
 
 
 class GoogleDriveClient(GoogleDrive):
-    def __init__(self, auth):
+    def __init__(self, auth, jobs: int = 8, cache: Path = None, cache_ttl: float = 3600, retries: int = 5,
+                 compress: bool = False, chunk_size: int = 8 << 20):
+        '''
+        jobs is the maximum number of concurrent requests, retries the maximum number of retries of
+        a request failing with a rate limit or server error.
+        cache is an optional file where remote tree listing is stored, so that it can be reused by later
+        calls, until Drive reports a change or cache_ttl seconds elapsed.
+        compress enables gzip compression of uploaded data files. An uploaded file replaces its remote
+        compressed (or uncompressed) version, which is trashed. Files bigger than chunk_size bytes
+        are uploaded by chunks, so that an interrupted upload resumes from the last acknowledged chunk.
+        '''
+        self.scheduler = Scheduler(
+            jobs=jobs, retries=retries, is_retryable=self.is_retryable)
+        self.compress = compress
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.cache_ttl = cache_ttl
         return super().__init__(auth=auth)
 
     def __enter__(self):
@@ -19,6 +48,25 @@ class GoogleDriveClient(GoogleDrive):
     def __exit__(self, exc_type, exc_val, exc_tb):
         return None
 
+    @staticmethod
+    def is_retryable(error):
+        '''
+        Rate limits (403 and 429), server errors and network failures are worth retrying.
+        '''
+        if isinstance(error, ApiRequestError) and error.args:
+            error = error.args[0]
+        if isinstance(error, HttpError):
+            status = error.resp.status
+            if status == 403:
+                try:
+                    reasons = [e.get('reason') for e in json.loads(
+                        error.content)['error']['errors']]
+                except (ValueError, KeyError, TypeError):
+                    return False
+                return bool({'rateLimitExceeded', 'userRateLimitExceeded'} & set(reasons))
+            return status in [429, 500, 502, 503, 504]
+        return isinstance(error, (ConnectionError, TimeoutError))
+
     @staticmethod
     def is_folder(file):
         return file['mimeType'] == 'application/vnd.google-apps.folder'
@@ -29,38 +77,216 @@ class GoogleDriveClient(GoogleDrive):
         return self.is_folder(file)
 
     def list_folder(self, id: str):
-        for file_list in self.ListFile({'q': "'%s' in parents and trashed=false" % id, 'maxResults': 100}):
+        for file_list in self.ListFile({'q': "'%s' in parents and trashed=false" % id, 'maxResults': 1000}):
             for file in file_list:
                 yield file
 
+    @LoadAuth
+    def changes_token(self):
+        '''
+        Gets Drive current changes token, which is modified by any change to the drive.
+        '''
+        return self.auth.service.changes().getStartPageToken().execute(
+            http=self.http)['startPageToken']
+
+    @LoadAuth
+    def changes_since(self, token: str):
+        '''
+        Gets ids of files changed since a changes token, and the current changes token.
+        '''
+        ids = set()
+        while True:
+            changes = self.auth.service.changes().list(
+                pageToken=token, maxResults=1000, fields='items/fileId,nextPageToken,newStartPageToken').execute(
+                http=self.http)
+            ids.update(change['fileId'] for change in changes.get('items', []))
+            if 'newStartPageToken' in changes:
+                return ids, changes['newStartPageToken']
+            token = changes['nextPageToken']
+
     @staticmethod
     def _build_local_tree(path: Path, match: str):
         for p in path.rglob(match):
             yield PurePath.relative_to(p, path)
 
+    @staticmethod
+    def is_synced(path: Path, file):
+        '''
+        Checks whether local file matches remote one, so it doesn't need to be transferred.
+        Sizes are compared first, then modification dates, then checksums.
+        '''
+        if not path.is_file() or GoogleDriveClient.is_folder(file):
+            return False
+        stat = path.stat()
+        if int(file.get('fileSize', -1)) != stat.st_size:
+            return False
+        if stat.st_mtime == GoogleDriveClient.modified_timestamp(file):
+            return True
+        return file.get('md5Checksum') == manifest.md5(path)
+
+    @staticmethod
+    def is_compressible(path: Path):
+        return path.suffix in ['.csv']
+
+    @staticmethod
+    def compress_file(path: Path, destination: Path):
+        '''
+        Compresses path to destination. Gzip header has no name nor time, so that compressed file
+        only depends on content and can be compared with remote checksum.
+        '''
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'rb') as src, open(destination, 'wb') as dst:
+            with gzip.GzipFile(filename='', mode='wb', fileobj=dst, mtime=0) as gz:
+                shutil.copyfileobj(src, gz)
+        return destination
+
+    @staticmethod
+    def decompress_file(path: Path, destination: Path):
+        with gzip.open(path, 'rb') as src, open(destination, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        return destination
+
+    @staticmethod
+    def modified_timestamp(file):
+        return datetime.fromisoformat(file['modifiedDate'].replace('Z', '+00:00')).timestamp()
+
+    @staticmethod
+    def _summarize(direction: str, summary: dict, transfers: dict, outcomes: dict, dry_run: bool):
+        '''
+        Reports per file outcome and completes transfer summary with transferred and failed files.
+        transfers is a dict of path -> (bytes on the wire, logical bytes) of the files to transfer.
+        Logical bytes are replaced by the ones returned by transfer tasks once they're completed.
+        '''
+        for path, outcome in sorted(outcomes.items()):
+            logging.debug('%s %s in %.2fs, %d attempts.' % (
+                'Failed' if outcome['error'] else direction.capitalize(), path, outcome['elapsed'], outcome['attempts']))
+        failed = failures(outcomes)
+        done = [path for path in transfers if path not in failed]
+        summary['files'] = len(done)
+        summary['bytes'] = sum(transfers[path][0] for path in done)
+        summary['logical_bytes'] = sum(outcomes[path]['result'] if path in outcomes else transfers[path][1]
+                                       for path in done)
+        summary['failed'] = [str(path) for path in failed]
+
+        prefix = 'Would have ' + direction if dry_run else direction.capitalize()
+        logging.info('%s %d files (%d bytes on the wire, %d logical bytes), skipped %d unchanged files (%d bytes).' % (
+            prefix, summary['files'], summary['bytes'], summary['logical_bytes'], summary['skipped_files'], summary['skipped_bytes']))
+        if failed:
+            logging.error('Failed to transfer %d files: %s' %
+                          (len(failed), ', '.join(summary['failed'])))
+        return summary
+
+    @LoadAuth
+    def _resumable_upload(self, file, path: Path):
+        '''
+        Uploads file content by chunks. Upload request is kept with the file until it completes, so
+        that when the scheduler retries a failed upload, it resumes from the last chunk acknowledged by
+        the server instead of starting over.
+        '''
+        http = self.auth.Get_Http_Object()
+        request = getattr(file, 'upload_request', None)
+        if request is None:
+            media = MediaFileUpload(str(path), mimetype=file.get('mimeType') or 'application/octet-stream',
+                                    chunksize=self.chunk_size, resumable=True)
+            if file.get('id'):
+                request = self.auth.service.files().update(
+                    fileId=file['id'], media_body=media)
+            else:
+                request = self.auth.service.files().insert(
+                    body=dict(file), media_body=media)
+            file.upload_request = request
+
+        response = None
+        while response is None:
+            status, response = request.next_chunk(http=http)
+            if status:
+                logging.debug('Uploaded %d%% of %s.' %
+                              (status.progress() * 100, path))
+        file.upload_request = None
+        file.uploaded = True
+        file.UpdateMetadata(response)
+
+    def _list_remote_tree(self, id: str):
+        '''
+        Lists all files and folders below folder id, breadth first.
+        All folders of a level are listed concurrently.
+        '''
+        def _list(id):
+            with instrument.call('drive', 'list'):
+                return list(self.list_folder(id))
+
+        tree = {}
+        level = {Path(): id}
+        while level:
+            outcomes = self.scheduler.run({path: (_list, id)
+                                           for path, id in level.items()})
+            failed = failures(outcomes)
+            if failed:
+                raise RuntimeError('Failed to list remote folders: %s' % failed)
+            level = {}
+            for path, outcome in outcomes.items():
+                for file in outcome['result']:
+                    this_path = path / file['title']
+                    tree[this_path] = file
+                    if self.is_folder(file):
+                        level[this_path] = file['id']
+        return tree
+
+    def _load_cached_tree(self, id: str, token: str):
+        '''
+        Loads the cached tree of folder id, if it's still valid for drive changes token.
+        '''
+        if not self.cache or not self.cache.exists():
+            return None
+        with open(self.cache) as f:
+            cached = json.load(f)
+        if cached['id'] != id or time.time() - cached['time'] > self.cache_ttl:
+            logging.info('Remote tree cache expired.')
+            return None
+        if cached['token'] != token:
+            logging.info('Remote tree cache invalidated by drive changes.')
+            return None
+        logging.info('Using remote tree cache: %s.' % self.cache)
+        return {Path(path): GoogleDriveFile(auth=self.auth, metadata=metadata, uploaded=True)
+                for path, metadata in cached['files'].items()}
+
+    def _save_cached_tree(self, id: str, tree: dict, token: str):
+        '''
+        Caches the tree of folder id, token being the drive changes token it's up to date with. It must be
+        fetched before listing, so that changes made while listing invalidate the cache.
+        '''
+        if not self.cache:
+            return
+        cached = {'id': id, 'time': time.time(), 'token': token,
+                  'files': {str(path): dict(file) for path, file in tree.items()}}
+        self.cache.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.cache, 'w') as f:
+            json.dump(cached, f)
+
     def _build_remote_tree(self, id: str, match: str):
+        '''
+        Gets the files below folder id that match pattern, and the drive changes token they're up to date
+        with, None if caching is disabled.
+        '''
         file = self.CreateFile({'id': id})
         file.FetchMetadata()
 
         tree = {}
+        token = None
         if self.is_folder(file):
-            def recurse(file, path: Path):
-                this_path = path / file['title']
-                yield (this_path, file)
-                if self.is_folder(file):
-                    for inner in self.list_folder(file['id']):
-                        yield from recurse(inner, this_path)
-
-            tree = {path: f for inner in self.list_folder(file['id'])
-                    for (path, f) in recurse(inner, Path())}
+            token = self.changes_token() if self.cache else None
+            tree = self._load_cached_tree(id, token)
+            if tree is None:
+                tree = self._list_remote_tree(id)
+                self._save_cached_tree(id, tree, token)
         else:
             tree = {Path(file['title']): file}
 
         # Filters for match pattern
         subtree = {k: v for k, v in tree.items() if k.match(match)}
-        return subtree
+        return subtree, token
 
-    def download(self, local: Path, remote_id: str, remote_subfolder: Path, match: str):
+    def download(self, local: Path, remote_id: str, remote_subfolder: Path, match: str, dry_run: bool = False):
         if not local.exists():
             raise ValueError('Destination path %s does not exist' % str(local))
         if not local.is_dir():
@@ -70,7 +296,7 @@ class GoogleDriveClient(GoogleDrive):
             raise ValueError('Source id %s must be a folder' % str(remote_id))
 
         # Build remote tree of files / folder
-        remote_tree = self._build_remote_tree(remote_id, match)
+        remote_tree, _ = self._build_remote_tree(remote_id, match)
 
         # Filters for the requested subfolder
         filtered_subtree = {k.relative_to(remote_subfolder): v for k, v in remote_tree.items(
@@ -79,29 +305,64 @@ class GoogleDriveClient(GoogleDrive):
             logging.info('No file found for subfolder %s',
                          str(remote_subfolder))
 
-        # Download filtered tree
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        # Compressed files are decompressed to their original name. If both versions
+        # exist, the latest one is downloaded.
+        targets = {}
+        for path, file in sorted(filtered_subtree.items()):
+            target = path.with_suffix('') if path.suffix == '.gz' else path
+            if target not in targets or self.is_folder(file) or \
+                    self.modified_timestamp(file) > self.modified_timestamp(targets[target][1]):
+                targets[target] = (path, file)
+
+        def _download(file, path: Path, wire: Path):
+            with instrument.call('drive', 'download') as call:
+                file.GetContentFile(wire)
+                call['bytes'] = wire.stat().st_size
+            if wire != path:
+                self.decompress_file(wire, path)
+            else:
+                # Keeps remote modification date, so checksum can be skipped next time
+                modified = self.modified_timestamp(file)
+                os.utime(path, (modified, modified))
+            return path.stat().st_size
 
-        async def async_download():
-            futures = []
-            for path, file in sorted(filtered_subtree.items()):
-                this_path = local / path
+        # Download filtered tree
+        summary = {'skipped_files': 0, 'skipped_bytes': 0}
+        transfers = {}
+        tasks = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for target, (path, file) in sorted(targets.items()):
+                this_path = local / target
+                compressed = path != target
                 if self.is_folder(file):
                     logging.info('Creating folder: %s, id: %s' %
                                  (path, file['id']))
-                    this_path.mkdir(parents=True, exist_ok=True)
-                else:
+                    if not dry_run:
+                        this_path.mkdir(parents=True, exist_ok=True)
+                    continue
+
+                wire = Path(tmp) / path if compressed else this_path
+                if compressed and this_path.is_file():
+                    self.compress_file(this_path, wire)
+                if self.is_synced(wire, file):
+                    logging.debug('Skipping unchanged file: %s' % path)
+                    summary['skipped_files'] += 1
+                    summary['skipped_bytes'] += int(file['fileSize'])
+                    continue
+
+                logging.info('Downloading file: %s, id: %s, mine: %s' % (
+                    path, file['id'], file['mimeType']))
+                size = int(file.get('fileSize', 0))
+                transfers[path] = (size, size)
+                if not dry_run:
                     this_path.parent.mkdir(parents=True, exist_ok=True)
-                    logging.info('Downloading file: %s, id: %s, mine: %s' % (
-                        path, file['id'], file['mimeType']))
-                    futures.append(loop.run_in_executor(
-                        None, file.GetContentFile, this_path))
-            [await f for f in futures]
+                    wire.parent.mkdir(parents=True, exist_ok=True)
+                    tasks[path] = (_download, file, this_path, wire)
 
-        loop.run_until_complete(async_download())
+            outcomes = self.scheduler.run(tasks)
+        return self._summarize('downloaded', summary, transfers, outcomes, dry_run)
 
-    def upload(self, local: Path, remote_id: str, remote_subfolder: Path, match: str):
+    def upload(self, local: Path, remote_id: str, remote_subfolder: Path, match: str, dry_run: bool = False):
         if not local.exists():
             raise ValueError('Source path %s does not exist' % str(local))
         if not local.is_dir():
@@ -112,57 +373,140 @@ class GoogleDriveClient(GoogleDrive):
 
         # Gather local data and remote data
         logging.info('Globing local path: %s.' % (local))
-        local_tree = self._build_local_tree(local, match)
-        remote_tree = self._build_remote_tree(remote_id, '*')
+        local_tree = sorted(self._build_local_tree(local, match))
+        remote_tree, token = self._build_remote_tree(remote_id, '*')
 
-        def _create_file(path, is_dir):
-            logging.info('Creating %s: %s' %
-                         ('folder' if is_dir else 'file', str(path)))
-            meta = {'title': str(path.name),
+        def _file_meta(path, is_dir):
+            return {'title': str(path.name),
                     'parents': [{'id': remote_id if len(
                         path.parents) == 1 else remote_tree[path.parent]['id']}],
-                    'mimeType': 'application/vnd.google-apps.folder' if is_dir else ''}
-            file = self.CreateFile(meta)
-            file.Upload()
+                    'mimeType': 'application/vnd.google-apps.folder' if is_dir else
+                    ('application/gzip' if path.suffix == '.gz' else '')}
+
+        def _create_folder(path):
+            logging.info('Creating folder: %s' % str(path))
+            file = self.CreateFile(_file_meta(path, True))
+            with instrument.call('drive', 'create_folder'):
+                file.Upload()
             return file
 
-        # Make sure remote subfolder exists
+        def _upload(file, local_path, wire):
+            with instrument.call('drive', 'upload') as call:
+                call['bytes'] = wire.stat().st_size
+                if call['bytes'] > self.chunk_size:
+                    self._resumable_upload(file, wire)
+                else:
+                    file.SetContentFile(str(wire))
+                    file.Upload()
+            return local_path.stat().st_size
+
+        # Lists missing remote folders, including remote subfolder itself
         def parents(path: Path):
             while len(path.parents):
                 yield path
                 path = path.parent
 
-        for path in sorted(parents(remote_subfolder)):
-            if not remote_tree.get(path, None):
-                remote_tree[path] = _create_file(path, True)
+        folders = set(parents(remote_subfolder))
+        for path in local_tree:
+            folders.update(parents(remote_subfolder / path if (local / path).is_dir()
+                                   else remote_subfolder / path.parent))
+        folders = [path for path in folders if path not in remote_tree]
+
+        # Creates missing folders level by level, as they must exist before their children
+        if not dry_run:
+            for depth in sorted(set(len(path.parts) for path in folders)):
+                outcomes = self.scheduler.run({path: (_create_folder, path)
+                                               for path in folders if len(path.parts) == depth})
+                failed = failures(outcomes)
+                if failed:
+                    raise RuntimeError(
+                        'Failed to create remote folders: %s' % failed)
+                remote_tree.update({path: outcome['result']
+                                   for path, outcome in outcomes.items()})
 
         # Upload local tree
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-        async def async_upload():
-            futures = []
-            for path in sorted(local_tree):
+        summary = {'skipped_files': 0, 'skipped_bytes': 0}
+        transfers = {}
+        remote_paths = {}
+        replaced = {}
+        tasks = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for path in local_tree:
                 local_path = local / path
-                is_dir = local_path.is_dir()
+                if local_path.is_dir():
+                    continue
+
+                # Compressed files are stored remotely with a .gz extension
+                compressed = self.compress and self.is_compressible(path)
+                remote_path = remote_subfolder / \
+                    (path.with_name(path.name + '.gz') if compressed else path)
+                wire = self.compress_file(local_path, Path(tmp) / remote_path) \
+                    if compressed else local_path
+
+                # A compressed file replaces its uncompressed version, and the other way round
+                other = remote_path.with_suffix('') if compressed else \
+                    remote_path.with_name(remote_path.name + '.gz')
+                if other in remote_tree and not self.is_folder(remote_tree[other]):
+                    replaced[path] = other
 
-                remote_path = remote_subfolder / path
                 file = remote_tree.get(remote_path, None)
-                if not file:
-                    file = remote_tree[remote_path] = _create_file(
-                        remote_path, is_dir)
-
-                if not is_dir:
-                    logging.info('Uploading file: %s, id: %s, mine: %s' % (
-                        str(path), file['id'], file['mimeType']))
-                    file.SetContentFile(str(local_path))
-                    futures.append(
-                        loop.run_in_executor(None, file.Upload))
-
-            # Await completion
-            [await f for f in futures]
+                size = wire.stat().st_size
+                if file and self.is_synced(wire, file):
+                    logging.debug('Skipping unchanged file: %s' % path)
+                    summary['skipped_files'] += 1
+                    summary['skipped_bytes'] += size
+                    continue
+
+                logging.info('Uploading file: %s' % str(remote_path))
+                transfers[path] = (size, local_path.stat().st_size)
+                if not dry_run:
+                    if not file:  # Files are created with their content
+                        file = remote_tree[remote_path] = self.CreateFile(
+                            _file_meta(remote_path, False))
+                    remote_paths[path] = remote_path
+                    tasks[path] = (_upload, file, local_path, wire)
+
+            outcomes = self.scheduler.run(tasks)
+
+        # Replaced files are trashed once their replacement is uploaded
+        failed = failures(outcomes)
+        replaced = {path: other for path,
+                    other in replaced.items() if path not in failed}
+        for other in sorted(replaced.values()):
+            logging.info('%s replaced file: %s' %
+                         ('Would have trashed' if dry_run else 'Trashing', other))
+
+        def _trash(file):
+            with instrument.call('drive', 'trash'):
+                file.Trash()
+
+        if not dry_run:
+            touched = [remote_tree[other] for other in replaced.values()]
+            trashed = self.scheduler.run({other: (_trash, remote_tree[other])
+                                          for other in replaced.values()})
+            for other in failures(trashed):
+                logging.error('Failed to trash replaced file: %s' % other)
+            for other, outcome in trashed.items():
+                if not outcome['error']:
+                    del remote_tree[other]
+
+        # Remote tree now includes uploaded files. It's up to date with the current changes token only
+        # if drive changes since listing are this upload's ones, otherwise next run lists it again
+        if not dry_run:
+            touched += [remote_tree[path] for path in folders] + \
+                [task[1] for task in tasks.values()]
+            for path in failed:
+                if not remote_tree[remote_paths[path]].get('id'):
+                    del remote_tree[remote_paths[path]]
+            if token is not None:
+                changed, current = self.changes_since(token)
+                if changed <= {file.get('id') for file in touched}:
+                    token = current
+                else:
+                    logging.info('Remote tree changed while uploading.')
+            self._save_cached_tree(remote_id, remote_tree, token)
 
-        loop.run_until_complete(async_upload())
+        return self._summarize('uploaded', summary, transfers, outcomes, dry_run)
 
 
 def authenticate(key):
@@ -192,15 +536,40 @@ if __name__ == '__main__':
                         help='Match paths against the provided pattern.')
     parser.add_argument('-c', '--credentials', default='',
                         help='Google Service Account credentials as base64 string.', required=True)
+    parser.add_argument('-n', '--dry_run', default=False, action=argparse.BooleanOptionalAction,
+                        help='Only reports files that would be transferred.')
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                        help='Maximum number of concurrent requests, default=8')
+    parser.add_argument('-r', '--retries', type=int, default=5,
+                        help='Maximum number of retries of a request failing with a rate limit or server error, default=5')
+    parser.add_argument('-z', '--compress', default=False, action=argparse.BooleanOptionalAction,
+                        help='Gzips uploaded data files. Compressed files are always decompressed when downloaded.')
+    parser.add_argument('--chunk_size', type=int, default=8,
+                        help='Files bigger than this size (MiB) are uploaded by resumable chunks, default=8')
+    parser.add_argument('--cache', default=None,
+                        help='Remote tree cache file. Disabled by default.')
+    parser.add_argument('--cache_ttl', type=float, default=3600,
+                        help='Remote tree cache time to live in seconds, default=3600')
+    parser.add_argument('--report', default=None,
+                        help='Writes transfer metrics and drive calls latencies to this json file at exit')
+    parser.add_argument('--profile', default=None,
+                        help='Dumps cProfile and tracemalloc statistics of the transfer to this directory')
     parser.add_argument('-ll', '--loglevel', default='info',
                         help='Logging level. Example --loglevel debug, default=info')
     args = parser.parse_args()
 
     logging.basicConfig(level=args.loglevel.upper())
+    instrument.setup(args.report, args.profile)
 
     key = json.loads(base64.b64decode(args.credentials))
     auth = authenticate(key)
-    with GoogleDriveClient(auth) as drive:
+    cache = Path(args.cache) if args.cache else None
+    with GoogleDriveClient(auth, args.jobs, cache, args.cache_ttl, args.retries,
+                           args.compress, args.chunk_size << 20) as drive:
         to_call = drive.download if args.direction == 'download' else drive.upload
-        to_call(Path(args.local), args.drive, Path(
-            args.drive_subfolder), args.match)
+        with instrument.stage(args.direction, profile=True):
+            summary = to_call(Path(args.local), args.drive, Path(
+                args.drive_subfolder), args.match, args.dry_run)
+        instrument.count(args.direction, bytes=summary['bytes'], files=summary['files'])
+        if summary['failed']:
+            sys.exit('%d files failed to transfer.' % len(summary['failed']))
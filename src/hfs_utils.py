@@ -1,7 +1,9 @@
 from pathlib import Path
 import csv
+import threading
 import datetime
 import pytz
+import numpy as np
 import pandas as pd
 import pyhfs
 
@@ -10,28 +12,79 @@ def flatten(data, timezone):
     '''
     Convert list of dataItemMap to a flat list of data.
     Fixup also non standard units, like time
+    Columns are built in bulk, input data isn't modified.
     '''
-    def iterate(data):
-        for entry in data:
-            line = entry.get('dataItemMap')
-            if line:
-                line['stationCode'] = entry['stationCode']
-            else:
-                line = entry
-
-            # Copy collect time
-            if 'collectTime' in entry.keys():
-                line['collectTime'] = entry['collectTime']
-
-            # Fix up time
-            dates = ['collectTime', 'raiseTime']
-            for date in dates:
-                if date in line.keys():
-                    utc_date = pyhfs.Client.from_timestamp(line[date])
-                    line[date] = utc_date.astimezone(timezone)
-            yield line
-
-    return pd.DataFrame(iterate(data))
+    maps = [entry.get('dataItemMap') for entry in data]
+    df = pd.DataFrame([line if line else entry for line,
+                      entry in zip(maps, data)])
+    # Columns in order of first appearance, station code and collect time following dataItemMap keys
+    signatures = dict.fromkeys(tuple(line) + ('stationCode',) + (('collectTime',) if 'collectTime' in entry else ())
+                               if line else tuple(entry) for line, entry in zip(maps, data))
+    columns = list(dict.fromkeys(col for signature in signatures for col in signature))
+
+    # Copy station code and collect time to dataItemMap lines
+    mapped = np.array([bool(line) for line in maps], dtype=bool)
+    if mapped.any():
+        df.loc[mapped, 'stationCode'] = [entry['stationCode']
+                                         for entry, m in zip(data, mapped) if m]
+        timed = mapped & np.array(
+            ['collectTime' in entry for entry in data], dtype=bool)
+        if timed.any():
+            df.loc[timed, 'collectTime'] = [entry['collectTime']
+                                            for entry, t in zip(data, timed) if t]
+
+    # Fix up time, from utc milliseconds timestamps
+    for date in ['collectTime', 'raiseTime']:
+        if date in df.columns:
+            df[date] = pd.to_datetime(
+                df[date], unit='ms', utc=True).dt.tz_convert(timezone)
+
+    return df if list(df.columns) == columns else df[columns]
+
+
+def get_plant_realtime_data(client: pyhfs.Client, plants: list):
+    '''
+    Gets real-time plant data as pyhfs.Client.get_plant_realtime_data() does, with its own request
+    parameters. pyhfs stores plant codes in a default parameters dict shared by all clients, so that
+    concurrent calls could send each other's plant codes.
+    '''
+    return client._get_plant_data('getStationRealKpi', plants, {})
+
+
+def is_throttled(error: Exception):
+    '''
+    Tells if a request hit the interface per minute frequency limit (failCode 407), so that it's worth
+    retrying later. pyhfs.FrequencyLimit is also raised once the daily calls limit is reached (failCode
+    20618), which retrying within the day can't help.
+    '''
+    return isinstance(error, pyhfs.FrequencyLimit) and error.args[:1] == (407,)
+
+
+def locked_login(session):
+    '''
+    Serializes re-logins of a session shared by concurrent requests. pyhfs.Session logs in again each
+    request answered as not logged in (failCode 305), so that concurrent requests of an expired session
+    would all log in, each replacing the token others just got. A request only logs in if no other one
+    did since it was sent.
+    '''
+    lock = threading.Lock()
+    local = threading.local()
+    logins = 0
+    login, post = session.login, session.post
+
+    def relogin():
+        nonlocal logins
+        with lock:
+            if getattr(local, 'logins', None) in [None, logins]:
+                login()
+                logins += 1
+            local.logins = logins
+
+    def posted(endpoint, parameters={}):
+        local.logins = logins
+        return post(endpoint=endpoint, parameters=parameters)
+    session.login, session.post = relogin, posted
+    return session
 
 
 def descriptions():
@@ -0,0 +1,181 @@
+'''
+Lightweight instrumentation of ETL stages and external calls.
+Stages record wall time, process cpu time, peak resident memory, rows and bytes. Calls (api requests,
+drive transfers) record their count, errors, bytes and latencies. Metrics are accumulated by key, so
+that a stage run for each dataset pattern is reported per pattern.
+Everything is recorded in the current process, work done by process pools isn't accounted.
+'''
+from pathlib import Path
+from datetime import datetime
+from collections import deque
+import contextlib
+import threading
+import tracemalloc
+import cProfile
+import logging
+import atexit
+import json
+import time
+import sys
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+_lock = threading.Lock()
+_stages = {}
+_calls = {}
+_profile = {'path': None, 'active': False}
+# Latencies kept per call name for percentiles, so that a long running process memory stays bounded
+_latencies = 100000
+
+
+def peak_rss():
+    '''
+    Gets process peak resident memory in bytes, or None if unknown.
+    '''
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def key(name: str, pattern: str = None):
+    return name if pattern is None else name + '.' + pattern
+
+
+def count(name: str, pattern: str = None, rows: int = 0, bytes: int = 0, files: int = 0):
+    '''
+    Adds rows, bytes and files to a stage metrics.
+    '''
+    with _lock:
+        metrics = _stages.setdefault(key(name, pattern), {
+            'runs': 0, 'wall': 0., 'cpu': 0., 'peak_rss': None, 'rows': 0, 'bytes': 0, 'files': 0})
+        metrics['rows'] += int(rows)
+        metrics['bytes'] += int(bytes)
+        metrics['files'] += int(files)
+        return metrics
+
+
+@contextlib.contextmanager
+def stage(name: str, pattern: str = None, profile: bool = False):
+    '''
+    Records a stage wall and cpu time. cpu time is the whole process one, including worker threads.
+    Peak rss is the process high water mark at the end of the stage.
+    profile enables cProfile and tracemalloc statistics of the stage, if profiling is set up. cProfile
+    only sees the calling thread, and a profiled stage nested in another one isn't profiled.
+    '''
+    profiler = _start_profile() if profile else None
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        elapsed, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        metrics = count(name, pattern)
+        with _lock:
+            metrics['runs'] += 1
+            metrics['wall'] += elapsed
+            metrics['cpu'] += cpu
+            metrics['peak_rss'] = peak_rss()
+        if profiler:
+            _stop_profile(profiler, key(name, pattern))
+        logging.debug('Stage %s took %.3fs (%.3fs cpu).' %
+                      (key(name, pattern), elapsed, cpu))
+
+
+@contextlib.contextmanager
+def call(kind: str, name: str):
+    '''
+    Records an external call latency. Yields a dict whose 'bytes' can be set by the caller.
+    Failed calls are counted as errors. Latency percentiles are computed over the most recent calls.
+    '''
+    record = {'bytes': 0}
+    begin = time.perf_counter()
+    error = False
+    try:
+        yield record
+    except BaseException:
+        error = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - begin
+        with _lock:
+            calls = _calls.setdefault(kind, {}).setdefault(
+                name, {'latencies': deque(maxlen=_latencies), 'count': 0, 'total': 0., 'max': 0.,
+                       'errors': 0, 'bytes': 0})
+            calls['latencies'].append(elapsed)
+            calls['count'] += 1
+            calls['total'] += elapsed
+            calls['max'] = max(calls['max'], elapsed)
+            calls['errors'] += error
+            calls['bytes'] += int(record['bytes'])
+
+
+def summarize_calls(calls: dict):
+    latencies = np.array(calls['latencies'])
+    return {'count': calls['count'], 'errors': calls['errors'], 'bytes': calls['bytes'],
+            'total': calls['total'], 'mean': calls['total'] / calls['count'],
+            'p50': float(np.percentile(latencies, 50)), 'p95': float(np.percentile(latencies, 95)),
+            'max': calls['max']}
+
+
+def report():
+    '''
+    Gets recorded metrics.
+    '''
+    with _lock:
+        return {'argv': sys.argv, 'time': datetime.now().isoformat(),
+                'peak_rss': peak_rss(),
+                'stages': {k: dict(v) for k, v in _stages.items()},
+                'calls': {kind: {name: summarize_calls(calls) for name, calls in names.items()}
+                          for kind, names in _calls.items()}}
+
+
+def save(path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report(), f, indent=1)
+    logging.info('Instrumentation report written to %s.' % path)
+
+
+def setup(report_file: Path = None, profile_dir: Path = None):
+    '''
+    Writes the json report to report_file at exit, and enables profiling of hot stages to profile_dir.
+    Each profiled stage outputs a cProfile <stage>.prof file, readable with pstats, and a
+    <stage>.tracemalloc.txt file with the traced peak and the lines holding most memory at the end
+    of the stage.
+    '''
+    if report_file:
+        atexit.register(save, Path(report_file))
+    if profile_dir:
+        _profile['path'] = Path(profile_dir)
+        _profile['path'].mkdir(parents=True, exist_ok=True)
+
+
+def _start_profile():
+    with _lock:
+        if _profile['path'] is None or _profile['active']:
+            return None
+        _profile['active'] = True
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _stop_profile(profiler: cProfile.Profile, name: str):
+    profiler.disable()
+    snapshot = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    path = _profile['path']
+    profiler.dump_stats(path / (name + '.prof'))
+    with open(path / (name + '.tracemalloc.txt'), 'w') as f:
+        f.write('Peak traced memory: %d bytes\n' % peak)
+        for stat in snapshot.statistics('lineno')[:30]:
+            f.write(str(stat) + '\n')
+    logging.info('Profile of stage %s written to %s.' % (name, path))
+    with _lock:
+        _profile['active'] = False
@@ -0,0 +1,53 @@
+from pathlib import Path
+import hashlib
+import json
+
+
+def md5(path: Path, block_size=1 << 20):
+    '''
+    Computes md5 checksum of a file, as Google Drive does.
+    '''
+    h = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def fingerprint(path: Path):
+    '''
+    Gets a fingerprint (size, modification time and checksum) of a file.
+    '''
+    stat = path.stat()
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'md5': md5(path)}
+
+
+def unchanged(path: Path, entry: dict):
+    '''
+    Checks whether a file still matches its manifest entry.
+    Size and modification time are checked first, checksum is only computed when
+    modification time differs (ie: file was downloaded again).
+    '''
+    if not entry or not path.exists():
+        return False
+    stat = path.stat()
+    if stat.st_size != entry['size']:
+        return False
+    return stat.st_mtime == entry['mtime'] or md5(path) == entry['md5']
+
+
+def load(path: Path):
+    '''
+    Loads a manifest, or returns an empty one if it does not exist.
+    '''
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save(manifest: dict, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
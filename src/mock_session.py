@@ -0,0 +1,190 @@
+from datetime import datetime, timedelta
+import threading
+import random
+import time
+import numpy as np
+import pyhfs
+
+endpoints = ['stations', 'getStationRealKpi', 'getKpiStationHour', 'getKpiStationDay',
+             'getKpiStationMonth', 'getKpiStationYear', 'getAlarmList']
+
+
+def plant_code(index: int):
+    return 'NE=%08d' % index
+
+
+def periods(endpoint: str, date: datetime):
+    '''
+    Lists the collect times returned by a timed endpoint for a date.
+    '''
+    day = datetime(date.year, date.month, date.day)
+    if endpoint == 'getKpiStationHour':
+        return [day + timedelta(hours=h) for h in range(24)]
+    if endpoint == 'getKpiStationDay':
+        month = day.replace(day=1)
+        return [month + timedelta(days=d) for d in range(31) if (month + timedelta(days=d)).month == month.month]
+    if endpoint == 'getKpiStationMonth':
+        return [datetime(date.year, m, 1) for m in range(1, 13)]
+    return [datetime(date.year, 1, 1)]
+
+
+class Fleet:
+    '''
+    Fleet of 'plants' synthetic plants. Each payload is drawn from a generator seeded by the fleet seed,
+    the endpoint and the requested time, so that the same request always gets the same answer.
+    '''
+
+    def __init__(self, plants: int, seed: int = 0):
+        self.plants = plants
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.capacity = np.round(rng.uniform(3, 500, plants), 2)
+        self.latitude = np.round(rng.uniform(43, 50, plants), 4)
+        self.longitude = np.round(rng.uniform(-4, 7, plants), 4)
+        self.plant_list = [{'plantCode': plant_code(p), 'plantName': 'Plant %d' % p,
+                            'plantAddress': '%d rue du Soleil' % p, 'longitude': float(self.longitude[p]),
+                            'latitude': float(self.latitude[p]), 'capacity': float(self.capacity[p]),
+                            'contactPerson': '', 'gridConnectionDate': '2020-01-01T00:00:00+01:00'}
+                           for p in range(plants)]
+
+    def rng(self, endpoint: str, timestamp: int = 0):
+        return np.random.default_rng([self.seed, endpoints.index(endpoint), timestamp // 1000])
+
+    def indices(self, codes: list):
+        return [int(code[3:]) for code in codes if code.startswith('NE=') and int(code[3:]) < self.plants]
+
+    def realtime(self, indices: list):
+        rng = self.rng('getStationRealKpi')
+        health = rng.choice([1, 2, 3], self.plants, p=[.05, .05, .9])
+        day = rng.random(self.plants) * self.capacity * 5
+        total = day * rng.uniform(300, 3000, self.plants)
+        return [{'stationCode': plant_code(p),
+                 'dataItemMap': {'real_health_state': str(health[p]), 'day_power': str(round(day[p], 3)),
+                                 'month_power': str(round(day[p] * 20, 3)), 'total_power': str(round(total[p], 3)),
+                                 'day_income': str(round(day[p] * .1, 3)), 'total_income': str(round(total[p] * .1, 3))}}
+                for p in indices]
+
+    def timed(self, endpoint: str, indices: list, times: list):
+        '''
+        Generates energy data of each plant and each timestamp. Hourly data follow a daylight curve.
+        '''
+        rng = self.rng(endpoint, times[0])
+        shape = (self.plants, len(times))
+        hours = endpoint == 'getKpiStationHour'
+        if hours:
+            daylight = np.clip(
+                np.sin(np.pi * (np.arange(len(times)) - 6) / 12), 0, None)
+        else:
+            daylight = np.full(len(times), 4. * {'getKpiStationDay': 1, 'getKpiStationMonth': 30,
+                                                 'getKpiStationYear': 365}[endpoint])
+        radiation = daylight * rng.uniform(.2, 1, shape)
+        theory = radiation * self.capacity[:, None]
+        inverter = theory * rng.uniform(.7, .95, shape)
+        return [{'stationCode': plant_code(p), 'collectTime': time,
+                 'dataItemMap': {'radiation_intensity': radiation[p, t], 'theory_power': theory[p, t],
+                                 'inverter_power': inverter[p, t], 'ongrid_power': None,
+                                 'power_profit': inverter[p, t] * .1,
+                                 'performance_ratio': None if hours else inverter[p, t] / max(theory[p, t], 1e-9) * 100,
+                                 'use_power': None}}
+                for p in indices for t, time in enumerate(times)]
+
+    def alarms(self, indices: list, begin: int, end: int):
+        '''
+        Generates active alarms raised between begin and end timestamps, alarms being cleared after 30 days.
+        Alarms of a day are drawn from the same generator, so that overlapping windows get the same alarms,
+        about one a month per plant.
+        '''
+        day = 86400000
+        alarms = []
+        for first in range(max(begin, end - 30 * day) // day * day, end + 1, day):
+            rng = self.rng('getAlarmList', first)
+            counts = rng.poisson(1. / 30, self.plants)
+            raised = first + rng.integers(0, day, counts.sum())
+            levels = rng.integers(1, 5, counts.sum())
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            alarms += [{'stationCode': plant_code(p), 'stationName': 'Plant %d' % p,
+                        'alarmId': 2064, 'alarmName': 'Low insulation resistance', 'alarmCause': 'Insulation',
+                        'causeId': 1, 'alarmType': 2, 'devName': 'Inverter %d' % p, 'devTypeId': 1,
+                        'esnCode': 'ES%08d' % p, 'lev': int(levels[a]), 'raiseTime': int(raised[a]), 'status': 1,
+                        'repairSuggestion': 'Check cables insulation'}
+                       for p in indices for a in range(offsets[p], offsets[p + 1])
+                       if begin <= raised[a] <= end]
+        return alarms
+
+
+class MockSession:
+    '''
+    Local stand-in for pyhfs.Session, answering Northbound interface requests from a synthetic fleet,
+    so that collection can be run and load tested without credentials.
+    '''
+    # Maximum number of plants per data request, as the Northbound interface
+    max_plants = 100
+
+    def __init__(self, plants: int = 100, seed: int = 0, latency: float = 0., page_size: int = 100,
+                 frequency_limit: float = 0.):
+        '''
+        plants is the fleet size, seed the synthetic data seed.
+        latency is the mean delay of a request in seconds, uniformly drawn between 0 and twice the mean.
+        page_size is the maximum number of plants of a plant list page. Data requests are limited to
+        max_plants plants, whatever page_size, as pyhfs.Client requests them by batches of 100.
+        frequency_limit is the probability of a request to fail with pyhfs.FrequencyLimit.
+        '''
+        self.fleet = Fleet(plants, seed)
+        self.latency = latency
+        self.page_size = page_size
+        self.frequency_limit = frequency_limit
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+
+    def __enter__(self):
+        self.login()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.logout()
+
+    def logout(self) -> None:
+        pass
+
+    def login(self) -> None:
+        pass
+
+    def post(self, endpoint, parameters={}):
+        '''
+        Answers a request as the Northbound interface would, after the simulated latency.
+        '''
+        with self.lock:
+            self.requests += 1
+            delay = self.random.uniform(0, 2 * self.latency)
+            throttled = self.random.random() < self.frequency_limit
+            self.throttled += throttled
+        time.sleep(delay)
+        if throttled:
+            raise pyhfs.FrequencyLimit(
+                407, 'The interface access frequency is too high.')
+        if endpoint not in endpoints:
+            raise pyhfs.Exception(0, 'Unknown endpoint %s.' % endpoint)
+        return {'success': True, 'failCode': 0, 'data': self.answer(endpoint, parameters)}
+
+    def answer(self, endpoint: str, parameters: dict):
+        fleet = self.fleet
+        if endpoint == 'stations':
+            size = min(parameters.get('pageSize', 100), self.page_size)
+            page = parameters.get('pageNo', 1)
+            return {'list': fleet.plant_list[(page - 1) * size:page * size],
+                    'pageCount': max(1, -(-fleet.plants // size)), 'pageNo': page, 'pageSize': size,
+                    'total': fleet.plants}
+
+        codes = parameters['stationCodes'].split(',')
+        if len(codes) > self.max_plants:
+            raise pyhfs.Exception(
+                0, 'Too many plants in a request: %d, maximum is %d.' % (len(codes), self.max_plants))
+        indices = fleet.indices(codes)
+        if endpoint == 'getStationRealKpi':
+            return fleet.realtime(indices)
+        if endpoint == 'getAlarmList':
+            return fleet.alarms(indices, parameters['beginTime'], parameters['endTime'])
+        date = datetime.fromtimestamp(parameters['collectTime'] / 1000.)
+        return fleet.timed(endpoint, indices, [pyhfs.Client.to_timestamp(t) for t in periods(endpoint, date)])
@@ -0,0 +1,128 @@
+import abc
+from pathlib import Path
+from datetime import datetime
+import pandas as pd
+import pyhfs
+
+import src.hfs_utils as hfs_utils
+import src.instrument as instrument
+from src.mock_session import MockSession
+
+
+class Provider(abc.ABC):
+    '''
+    Interface of a plants data provider, opened for a single account as a context manager.
+    Datasets are returned as flat dataframes of provider specific columns, which are standardized with
+    the provider configuration file, see etl_standardize.py.
+    '''
+    # Provider name, used as raw and std trees folder
+    name = None
+    # Standardization configuration file
+    config = None
+    # Time series granularities, as dataset names
+    granularities = ['realtime', 'hourly', 'daily', 'monthly', 'yearly']
+
+    def __init__(self, account: dict, tz):
+        '''
+        account holds provider specific credentials and options. tz is plants time zone.
+        '''
+        self.account = account
+        self.tz = tz
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return None
+
+    @staticmethod
+    def is_throttled(error: Exception):
+        '''
+        Tells if a request failed because of provider rate limits, so that it's worth retrying later.
+        '''
+        return False
+
+    @abc.abstractmethod
+    def plants(self) -> pd.DataFrame:
+        pass
+
+    @abc.abstractmethod
+    def plant_codes(self, plants: pd.DataFrame) -> list:
+        pass
+
+    @abc.abstractmethod
+    def series(self, granularity: str, plants: list, date: datetime) -> pd.DataFrame:
+        '''
+        Gets plants time series of a granularity, covering date.
+        '''
+
+    @abc.abstractmethod
+    def alarms(self, plants: list, begin: datetime, end: datetime) -> pd.DataFrame:
+        pass
+
+
+def fusion_solar_session(username: str, password: str, mock):
+    '''
+    Creates a Fusion Solar Northbound interface session, each request being instrumented as an api call
+    named after its endpoint. The session can be shared by concurrent requests, see
+    hfs_utils.locked_login(). mock replaces the interface with a local MockSession, it's either a bool
+    or a dict of MockSession options.
+    '''
+    if mock:
+        session = MockSession(**(mock if isinstance(mock, dict) else {}))
+    else:
+        session = pyhfs.Session(user=username, password=password)
+    post = hfs_utils.locked_login(session).post
+
+    def timed_post(endpoint, parameters={}):
+        with instrument.call('api', endpoint):
+            return post(endpoint=endpoint, parameters=parameters)
+    session.post = timed_post
+    return session
+
+
+class FusionSolar(Provider):
+    '''
+    Huawei Fusion Solar Northbound interface. Account keys are 'username', 'password' and optionally
+    'mock', see fusion_solar_session().
+    '''
+    name = 'fusion_solar'
+    config = Path(__file__).parent / 'fus2std.json'
+
+    def __enter__(self):
+        self.client = pyhfs.Client(fusion_solar_session(
+            self.account.get('username'), self.account.get('password'), self.account.get('mock', False)))
+        return self
+
+    @staticmethod
+    def is_throttled(error: Exception):
+        return hfs_utils.is_throttled(error)
+
+    def plants(self):
+        return pd.DataFrame(self.client.get_plant_list())
+
+    def plant_codes(self, plants: pd.DataFrame):
+        return list(plants.get('plantCode', []))
+
+    def series(self, granularity: str, plants: list, date: datetime):
+        if granularity == 'realtime':
+            data = hfs_utils.get_plant_realtime_data(self.client, plants)
+            for entry in data:  # Adds time information
+                entry.update({'collectTime': self.client.to_timestamp(date)})
+        else:
+            get = {'hourly': self.client.get_plant_hourly_data,
+                   'daily': self.client.get_plant_daily_data,
+                   'monthly': self.client.get_plant_monthly_data,
+                   'yearly': self.client.get_plant_yearly_data}[granularity]
+            data = get(plants, date)
+        return hfs_utils.flatten(data, self.tz)
+
+    def alarms(self, plants: list, begin: datetime, end: datetime):
+        return hfs_utils.flatten(self.client.get_alarms_list(plants, begin, end), self.tz)
+
+
+def providers():
+    '''
+    Gets available providers, as a dict of name -> Provider class.
+    '''
+    return {provider.name: provider for provider in [FusionSolar]}
@@ -0,0 +1,29 @@
+from collections import deque
+
+
+class RingBuffer:
+    '''
+    Bounded buffer of recent samples per key (ie: per plant).
+    A key holds up to 'capacity' samples, the oldest ones being dropped first, so that memory stays
+    bounded even if samples are never drained.
+    '''
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.samples = {}
+        self.dropped = 0
+
+    def __len__(self):
+        return sum(len(samples) for samples in self.samples.values())
+
+    def append(self, key, sample):
+        samples = self.samples.setdefault(key, deque(maxlen=self.capacity))
+        self.dropped += len(samples) == self.capacity
+        samples.append(sample)
+
+    def drain(self):
+        '''
+        Removes and returns all samples, grouped by key in insertion order.
+        '''
+        samples, self.samples = self.samples, {}
+        return [sample for key in samples.values() for sample in key]
@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import random
+import time
+
+
+class Scheduler:
+    '''
+    Runs tasks on a bounded thread pool.
+    Tasks failing with a retryable error are retried with exponential backoff and jitter.
+    A failing task never interrupts the other ones, its outcome reports the error instead.
+    '''
+
+    def __init__(self, jobs: int = 8, retries: int = 5, backoff: float = 1., max_backoff: float = 64., is_retryable=None):
+        '''
+        jobs is the maximum number of concurrent tasks.
+        retries is the maximum number of retries of a task, after its first attempt.
+        backoff is the first retry delay in seconds, doubled for each retry up to max_backoff.
+        is_retryable(exception) tells if a failed task should be retried, default to never.
+        '''
+        self.jobs = jobs
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.is_retryable = is_retryable if is_retryable else lambda e: False
+
+    def delay(self, attempt: int):
+        '''
+        Gets delay before retrying after 'attempt' failed attempts, with full jitter.
+        '''
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def attempt(self, name: str, func, *args):
+        '''
+        Calls func(*args), retrying on retryable errors.
+        Returns task outcome, as a dict with 'result', 'error', 'attempts' and 'elapsed' keys.
+        '''
+        begin = time.perf_counter()
+        outcome = {'result': None, 'error': None, 'attempts': 0}
+        while True:
+            outcome['attempts'] += 1
+            try:
+                outcome['result'] = func(*args)
+                break
+            except Exception as e:
+                if outcome['attempts'] > self.retries or not self.is_retryable(e):
+                    logging.error('Task %s failed after %d attempts: %s' %
+                                  (name, outcome['attempts'], repr(e)))
+                    outcome['error'] = e
+                    break
+                delay = self.delay(outcome['attempts'])
+                logging.warning('Task %s failed (%s), retrying in %.1fs.' %
+                                (name, repr(e), delay))
+                time.sleep(delay)
+        outcome['elapsed'] = time.perf_counter() - begin
+        return outcome
+
+    def run(self, tasks: dict):
+        '''
+        Runs tasks concurrently. tasks is a dict of name -> (func, *args).
+        Returns a dict of name -> outcome, see attempt().
+        '''
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            futures = {name: pool.submit(self.attempt, name, *task)
+                       for name, task in tasks.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+
+def failures(outcomes: dict):
+    '''
+    Gets the names of failed tasks.
+    '''
+    return [name for name, outcome in outcomes.items() if outcome['error']]
@@ -1,72 +1,369 @@
 from pathlib import Path
+import os
 import csv
 import glob
 import datetime
+import logging
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+def storage_formats():
+    '''
+    Gets supported storage formats, which are also files extension.
+    csv is the default, parquet is a typed columnar format that preserves categoricals and dates.
+    '''
+    return ['csv', 'parquet']
+
+
+def is_storage_file(path: Path):
+    return path.suffix[1:] in storage_formats()
 
 
 def to_csv(data: pd.DataFrame, path: Path):
     '''
-    Dumps list of entries to csv.
+    Dumps list of entries to csv, or to parquet if path has a .parquet extension.
+    File is written atomically, so an interrupted write never leaves a partial file.
     '''
     path.parent.mkdir(parents=True, exist_ok=True)
-    data.to_csv(path, index=False)
+    tmp = path.with_name(path.name + '.tmp')
+    if path.suffix == '.parquet':
+        # Stores typed columns, so they don't need to be parsed again when loading
+        typify(data.copy()).to_parquet(tmp, index=False)
+    else:
+        data.to_csv(tmp, index=False)
+    os.replace(tmp, path)
 
 
-def from_csv(path: Path):
-    df = pd.read_csv(str(path))
-    return df
+def from_csv(path: Path, columns: list = None, typed: bool = True):
+    '''
+    Loads a csv or a parquet file, depending on path extension.
+    Only the columns listed in 'columns' are loaded if specified, missing ones are ignored.
+    If typed, csv columns are parsed with the types declared by the dataset schema (see schemas()),
+    falling back to inferred types if file doesn't match it.
+    Floats are parsed back exactly as written, so that a file merged again (ie: an aggregated file) is
+    written back unchanged.
+    '''
+    if Path(path).suffix == '.parquet':
+        if columns is not None:
+            import pyarrow.parquet
+            names = pyarrow.parquet.read_schema(path).names
+            columns = [c for c in names if c in columns]
+        return pd.read_parquet(path, columns=columns)
+
+    usecols = (lambda c: c in columns) if columns is not None else None
+    if typed:
+        dtype = csv_dtypes(path)
+        try:
+            return pd.read_csv(str(path), usecols=usecols, dtype=dtype, float_precision='round_trip')
+        except pd.errors.EmptyDataError:
+            raise
+        except (ValueError, TypeError) as e:
+            logging.warning('File %s does not match %s schema (%s), loading it with inferred types.' %
+                            (path, dataset(path), e))
+    return pd.read_csv(str(path), usecols=usecols, float_precision='round_trip')
 
 
-def from_csvs(path: Path, pattern: str):
+def csv_dtypes(path: Path):
     '''
-    Returns a list (generator) of dataframe loaded from all csv files that matches the pattern.
+    Gets csv parser types of a dataset file columns, see schemas().
+    Dates are parsed by typify, as parser can't drop time zones.
     '''
-    aggregated = pd.DataFrame()
-    for filename in path.glob(pattern):
-        aggregated = pd.concat([aggregated, from_csv(filename)])
+    return {col: 'category' if isinstance(kind, pd.CategoricalDtype) else kind
+            for col, kind in schemas().get(dataset(path), {}).items() if kind != 'datetime64[ns]'}
+
+
+def file_columns(path: Path):
+    '''
+    Gets the columns of a csv or a parquet file, without loading it.
+    '''
+    if Path(path).suffix == '.parquet':
+        import pyarrow.parquet
+        return [c for c in pyarrow.parquet.read_schema(path).names if not c.startswith('__index_level_')]
+    return list(pd.read_csv(str(path), nrows=0).columns)
+
+
+def read_chunks(path: Path, rows: int):
+    '''
+    Loads a csv or a parquet file by chunks of up to 'rows' rows, typed as from_csv() does.
+    A csv file that doesn't match its schema is entirely loaded with inferred types, as from_csv() does,
+    then yielded by chunks.
+    '''
+    if Path(path).suffix == '.parquet':
+        import pyarrow.parquet
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=rows):
+            yield batch.to_pandas()
+        return
+
+    yielded = 0
+    try:
+        for chunk in pd.read_csv(str(path), dtype=csv_dtypes(path), chunksize=rows, float_precision='round_trip'):
+            yield chunk
+            yielded += len(chunk)
+        return
+    except pd.errors.EmptyDataError:
+        raise
+    except (ValueError, TypeError) as e:
+        logging.warning('File %s does not match %s schema (%s), loading it with inferred types.' %
+                        (path, dataset(path), e))
+    data = pd.read_csv(str(path), float_precision='round_trip')
+    for begin in range(yielded, len(data), rows):
+        yield data.iloc[begin:begin + rows].reset_index(drop=True)
+
 
-    aggregated.drop_duplicates(inplace=True, keep='last')
-    aggregated.fillna(0, inplace=True)
+def from_csvs(path: Path, pattern: str, workers: int = None, processes: bool = False, columns: list = None):
+    '''
+    Returns a dataframe loaded from all csv (or parquet) files that matches the pattern.
+    Files are loaded in name order, so that latest partitions win over older ones.
+    Entries are identified by their dataset primary key if all files belong to the same dataset.
+    '''
+    filenames = partition_files(path.glob(pattern))
+    datasets = set(dataset(f) for f in filenames)
+    keys = primary_keys().get(datasets.pop()) if len(datasets) == 1 else None
+    return merge(read_csvs(filenames, workers, processes, columns), keys)
+
+
+def read_csvs(filenames: list, workers: int = None, processes: bool = False, columns: list = None):
+    '''
+    Loads csv files concurrently, on a thread pool or a process pool, to be merged (see merge()).
+    Returned list of dataframes follows filenames order.
+    '''
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=workers) as pool:
+        return list(pool.map(read_typed, filenames, [columns] * len(filenames)))
+
+
+def read_typed(path: Path, columns: list = None):
+    '''
+    Loads a file as from_csv() does, with dates parsed, see typify(). Dates are parsed file by file, so
+    that loaded files never hold them as text all together.
+    '''
+    return typify(from_csv(path, columns))
+
+
+def merge(frames: list, keys: list = None):
+    '''
+    Concatenates dataframes in order and removes duplicated entries, keeping the last one.
+    If keys are specified (see primary_keys()), entries with the same keys are duplicated ones, so that
+    latest restated values win. Otherwise, entries are duplicated only if all their values are equal.
+    Frames are typed in place, and the list is emptied as they're merged, so that they can be freed.
+    '''
+    if not frames:
+        return pd.DataFrame()
+
+    # Types each frame first, so dates from typed and text files can be mixed
+    frames[:] = [typify(frame) for frame in frames]
+    # Frames share the same categories, so that concatenation keeps categorical columns
+    categoricals = [frame.select_dtypes('category').columns for frame in frames]
+    for col in set().union(*categoricals):
+        # Frames are referred to by position, so that no other list keeps them once they're filtered
+        typed = [index for index, cats in enumerate(categoricals) if col in cats]
+        try:
+            categories = sorted(set().union(
+                *[frames[index][col].cat.categories for index in typed]))
+        except TypeError:  # Mixed types categories can't be sorted, concatenated as objects
+            continue
+        for index in typed:
+            frames[index][col] = frames[index][col].cat.set_categories(categories)
+    keyed = keys is not None and all(
+        key in frame for frame in frames for key in keys)
+    if keyed:
+        # Duplicates are found from keys only, then only latest entries of each frame are concatenated.
+        # Keys are factorized column by column, by their distinct values, DataFrame.duplicated() sizes
+        # its hash tables by rows
+        latest = ~pd.MultiIndex.from_arrays([pd.concat([frame[key] for frame in frames], ignore_index=True)
+                                             for key in keys]).duplicated(keep='last')
+        bounds = np.cumsum([0] + [len(frame) for frame in frames])
+        for index, (begin, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            frames[index] = frames[index][latest[begin:end]]
+        del latest
+    aggregated = pd.concat(frames)
+    frames.clear()
+    for col in aggregated.select_dtypes('category'):
+        # Categories are restored by typify, once missing values are filled
+        if aggregated[col].isna().any():
+            aggregated[col] = aggregated[col].astype(object)
+    aggregated.fillna({col: 0 for col in aggregated.select_dtypes(
+        exclude='category')}, inplace=True)
     aggregated = typify(aggregated)
+    if not keyed:
+        aggregated.drop_duplicates(inplace=True, keep='last')
 
     return aggregated
 
 
-def typify(df: pd.DataFrame):
-    # Categories
-    cats = ['plant_code', 'plant_name', 'build_state', 'health_state']
+def typify(df: pd.DataFrame, schema: dict = None):
+    '''
+    Converts categories and dates columns to their declared types, see schemas().
+    All datasets schemas are used if none is specified.
+    '''
+    if schema is None:
+        schema = {col: kind for s in schemas().values()
+                  for col, kind in s.items()}
     for col in df.columns:
-        if col in cats:
-            df[col] = pd.Categorical(df[col])
+        kind = schema.get(col)
+        if isinstance(kind, pd.CategoricalDtype):
+            df[col] = categorize(df[col], kind)
+        elif kind == 'datetime64[ns]':
+            df[col] = to_datetime(df[col])
 
-    # Date
-    dates = ['collect_time', 'alarm_raise_time']
-    for col in df.columns:
-        if col in dates:
-            # Consider all times in plant time zone
-            df[col] = pd.to_datetime(df[col], utc=False, format='mixed').map(
-                lambda x: x.replace(tzinfo=None))
+    return df
 
+
+def conform(df: pd.DataFrame, name: str):
+    '''
+    Casts columns of an in memory dataset to the types from_csv() would parse them with.
+    Categories and dates are left to typify(). Columns that don't match their declared type are
+    kept as they are, as from_csv() falls back to inferred types.
+    '''
+    for col, kind in schemas().get(name, {}).items():
+        if col not in df or isinstance(kind, pd.CategoricalDtype) or kind == 'datetime64[ns]':
+            continue
+        try:
+            df[col] = df[col].astype(kind)
+        except (ValueError, TypeError) as e:
+            logging.warning('Column %s does not match %s schema (%s).' %
+                            (col, name, e))
     return df
 
 
+def categorize(data: pd.Series, dtype: pd.CategoricalDtype):
+    '''
+    Converts to a categorical, ordering categories as the declared vocabulary.
+    Values out of the vocabulary are kept, as extra categories.
+    '''
+    data = pd.Series(pd.Categorical(data), index=data.index, name=data.name)
+    if dtype.categories is None:
+        return data
+    vocabulary = list(dtype.categories)
+    extra = [c for c in data.cat.categories if c not in set(vocabulary)]
+    return data.cat.set_categories(vocabulary + extra)
+
+
+def to_datetime(data: pd.Series):
+    '''
+    Converts to dates, considering all times in plant time zone: time zone information is dropped.
+    '''
+    if isinstance(data.dtype, pd.DatetimeTZDtype):
+        return data.dt.tz_localize(None)
+    if pd.api.types.is_datetime64_dtype(data):
+        return data
+    # Dates are repeated for each plant, so only distinct ones are parsed
+    codes, uniques = pd.factorize(data)
+    if pd.api.types.infer_dtype(uniques, skipna=True) == 'string':
+        try:
+            # Strips utc offsets from iso formatted strings, then parses them all at once
+            dates = pd.to_datetime(pd.Series(uniques).str.replace(r'(\d\d:\d\d(?::\d\d(?:\.\d*)?)?)(?:Z|[+-]\d\d:?\d\d)$', r'\1', regex=True),
+                                   format=date_format())
+            # Missing values have code -1, which selects the trailing NaT
+            return pd.Series(np.append(dates.values, np.datetime64('NaT', 'ns'))[codes], index=data.index, name=data.name)
+        except ValueError:
+            pass
+    # Not only strings (ie: filled values), or not iso formatted
+    return pd.to_datetime(data, utc=False, format='mixed').map(
+        lambda x: x.replace(tzinfo=None))
+
+
 def file_patterns():
     return ['plants', 'realtime', 'hourly', 'daily', 'monthly', 'yearly', 'alarms']
 
 
-def format_filename(key, time: datetime.datetime):
+def dataset(path: Path):
+    '''
+    Gets dataset name from a partition or an aggregated file name, ie: hourly for hourly_2023-07-17.csv.
+    '''
+    return Path(path).stem.split('_')[0]
+
+
+def partition_key(path: Path):
+    '''
+    Sorts partition files in loading order. Extension is ignored, so that a compacted partition
+    (hourly_2023-07.csv) comes before the partitions of its period (hourly_2023-07-17.csv), which are
+    more recent as they were written after compaction.
+    '''
+    return Path(path).with_suffix('').parts
+
+
+def partition_files(filenames):
+    '''
+    Gets storage files of partitions in loading order (see partition_key()), one per partition.
+    A partition stored in both formats (ie: after a storage format change) would be loaded twice, only
+    its latest written file is kept.
+    '''
+    latest = {}
+    for filename in filter(is_storage_file, filenames):
+        key = partition_key(filename)
+        if key in latest:
+            older, filename = sorted([latest[key], filename], key=lambda f: f.stat().st_mtime)
+            logging.warning('Partition %s is also stored as %s, ignoring the older %s.' %
+                            (filename, older.name, older))
+        latest[key] = filename
+    return sorted(latest.values(), key=partition_key)
+
+
+def primary_keys():
+    '''
+    Gets the columns identifying an entry of each dataset in file_patterns().
+    An alarm id identifies an alarm kind, so an alarm is identified by its device and raise time too.
+    '''
+    series = ['plant_code', 'collect_time']
+    return {
+        'plants': ['plant_code'],
+        'realtime': series,
+        'hourly': series,
+        'daily': series,
+        'monthly': series,
+        'yearly': series,
+        'alarms': ['plant_code', 'device_sn', 'alarm_id', 'alarm_raise_time']
+    }
+
+
+def date_format():
+    '''
+    Gets format of dates in stored files.
+    '''
+    return 'ISO8601'
+
+
+def schemas():
+    '''
+    Gets schema of each dataset in file_patterns(), as a dict of column name to type.
+    Categorical columns declare their vocabulary when it's known. Dates are parsed as naive
+    datetime64 in plant time zone, see date_format().
+    '''
+    category = pd.CategoricalDtype()
+    plant = {'plant_code': category, 'plant_name': category}
+    time = {'collect_time': 'datetime64[ns]'}
+    energy = {col: 'float64' for col in ['radiation_intensity', 'theory_power', 'inverter_power', 'ongrid_power',
+                                         'power_profit', 'performance_ratio', 'use_power', 'perpower_ratio']}
+    return {
+        'plants': {**plant, 'build_state': category,
+                   'longitude': 'float64', 'latitude': 'float64', 'capacity': 'float64'},
+        'realtime': {**plant, **time,
+                     'health_state': pd.CategoricalDtype(['Disconnected', 'Faulty', 'Healthy']),
+                     **{col: 'float64' for col in ['day_power', 'month_power', 'total_power', 'day_income', 'total_income']}},
+        'hourly': {**plant, **time, **energy},
+        'daily': {**plant, **time, **energy},
+        'monthly': {**plant, **time, **energy},
+        'yearly': {**plant, **time, **energy},
+        'alarms': {**plant, 'alarm_raise_time': 'datetime64[ns]',
+                   'alarm_severity': pd.CategoricalDtype(['Critical', 'Major', 'Minor', 'Warning'])}
+    }
+
+
+def format_filename(key, time: datetime.datetime, format: str = 'csv'):
     year = time.strftime('%Y') + '/'
     formats = {
-        'plants': year + 'plants_' + time.strftime('%Y-%m') + '.csv',
-        'realtime': year + 'realtime_' + time.strftime('%Y-%m-%d') + '.csv',
-        'hourly': year + 'hourly_' + time.strftime('%Y-%m-%d') + '.csv',
-        'daily': year + 'daily_' + time.strftime('%Y-%m') + '.csv',
-        'monthly': year + 'monthly_' + time.strftime('%Y') + '.csv',
-        'yearly': year + 'yearly_' + time.strftime('%Y') + '.csv',
-        'alarms': year + 'alarms_' + time.strftime('%Y-%m-%d') + '.csv'
+        'plants': year + 'plants_' + time.strftime('%Y-%m'),
+        'realtime': year + 'realtime_' + time.strftime('%Y-%m-%d'),
+        'hourly': year + 'hourly_' + time.strftime('%Y-%m-%d'),
+        'daily': year + 'daily_' + time.strftime('%Y-%m'),
+        'monthly': year + 'monthly_' + time.strftime('%Y'),
+        'yearly': year + 'yearly_' + time.strftime('%Y'),
+        'alarms': year + 'alarms_' + time.strftime('%Y-%m-%d')
     }
-    return Path(formats[key])
+    return Path(formats[key] + '.' + format)
 
 
 def descriptions():
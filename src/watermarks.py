@@ -0,0 +1,39 @@
+from pathlib import Path
+from datetime import datetime, timedelta
+import json
+import os
+
+
+def load(path: Path):
+    '''
+    Loads watermarks json file, as a dict of plant code -> datetime. Missing file has no watermark.
+    '''
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return {code: datetime.fromisoformat(mark) for code, mark in json.load(f).items()}
+
+
+def save(path: Path, watermarks: dict):
+    '''
+    Writes watermarks atomically, so an interrupted write never loses them.
+    '''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump({code: mark.isoformat()
+                  for code, mark in sorted(watermarks.items())}, f, indent=1)
+    os.replace(tmp, path)
+
+
+def windows(watermarks: dict, codes: list, overlap: timedelta, origin: datetime = datetime(2000, 1, 1)):
+    '''
+    Groups plants by the beginning of their query window: their watermark minus overlap, so that late
+    updates are collected again, or origin for plants without watermark.
+    Returns a dict of begin datetime -> list of plant codes.
+    '''
+    groups = {}
+    for code in codes:
+        begin = watermarks[code] - overlap if code in watermarks else origin
+        groups.setdefault(begin, []).append(code)
+    return groups
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+from datetime import datetime
+
+import src.std_utils as std_utils
+import src.catalog as catalog
+
+
+@pytest.fixture
+def path(tmp_path):
+    plants = pd.DataFrame({'plant_code': ['NE=1', 'NE=2'], 'plant_name': ['One', 'Two'],
+                           'capacity': [10., 20.]})
+    hourly = pd.DataFrame({
+        'plant_code': ['NE=1', 'NE=2'] * 48,
+        'collect_time': pd.date_range('2023-07-01', periods=48, freq='h').repeat(2),
+        'inverter_power': range(96), 'theory_power': range(96)})
+    std_utils.to_csv(plants, tmp_path / 'agg' / 'plants.csv')
+    std_utils.to_csv(hourly, tmp_path / 'agg' / 'hourly.csv')
+    return tmp_path
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_load(path, cached):
+    data = catalog.Catalog(path / 'agg', cache=path / 'cache' if cached else None)
+    full = data.load('hourly')
+    begin, end = datetime(2023, 7, 1, 12), datetime(2023, 7, 2, 6)
+    subset = data.load('hourly', begin, end, ['inverter_power'])
+    expected = full.loc[(full['collect_time'] >= begin) & (full['collect_time'] <= end),
+                        ['plant_code', 'collect_time', 'inverter_power', 'plant_name']]
+    pd.testing.assert_frame_equal(subset.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_cache(path, monkeypatch):
+    loaded = catalog.Catalog(path / 'agg', cache=path / 'cache').load('hourly')
+    monkeypatch.setattr(std_utils, 'read_csvs', None)  # Sources aren't loaded again
+    data = catalog.Catalog(path / 'agg', cache=path / 'cache')
+    pd.testing.assert_frame_equal(data.load('hourly'), loaded)
+    assert list(data.read('hourly', ['inverter_power'])) == ['inverter_power']
+
+
+def test_derive(path):
+    computed = []
+
+    def ratio(catalog, data):
+        computed.append(len(data))
+        capacity = catalog['plants'].set_index('plant_code')['capacity']
+        return data['inverter_power'] / data['plant_code'].astype(object).map(capacity)
+
+    data = catalog.Catalog(path / 'agg')
+    data.derive('perpower_ratio', ratio, ['hourly', 'daily'])
+    assert computed == []  # Datasets aren't loaded
+    hourly = data['hourly']
+    assert computed == [96]
+    assert data['hourly'] is hourly
+    assert hourly['perpower_ratio'].iloc[3] == 3 / 20
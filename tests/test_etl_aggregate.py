@@ -0,0 +1,28 @@
+import pytest
+import pytz
+from pathlib import Path
+from datetime import datetime
+
+from benchmarks.synthetic import generate_std
+import etl_aggregate
+
+config = Path(__file__).parent.parent / 'src' / 'fus2std.json'
+tz = pytz.timezone('Europe/Paris')
+
+
+def aggregated(path: Path):
+    return {f.name: f.read_bytes() for f in path.glob('*.csv')}
+
+
+@pytest.mark.parametrize('memory', [None, 2**20])
+def test_incremental_equals_full(tmp_path, memory):
+    std, mock = tmp_path / 'std', {'plants': 5}
+    generate_std(std, mock, datetime(2023, 6, 1), datetime(2023, 6, 20), tz, config)
+    etl_aggregate.aggregate(std, tmp_path / 'agg', memory=memory)
+    generate_std(std, mock, datetime(2023, 6, 21), datetime(2023, 7, 3), tz, config)
+    etl_aggregate.aggregate(std, tmp_path / 'agg', memory=memory)
+    etl_aggregate.aggregate(std, tmp_path / 'full', full=True)
+    incremental, full = aggregated(tmp_path / 'agg'), aggregated(tmp_path / 'full')
+    assert list(incremental) == list(full)
+    for name in full:
+        assert incremental[name] == full[name], name
@@ -0,0 +1,27 @@
+import pytz
+from datetime import datetime
+
+import etl_collect
+import etl_collect_fus
+
+tz = pytz.timezone('Europe/Paris')
+accounts = {'accounts': [{'provider': 'fusion_solar', 'mock': {'plants': 3}},
+                         {'provider': 'fusion_solar', 'name': 'other', 'mock': {'plants': 2, 'seed': 1}}]}
+
+
+def test_collect_matches_fusion_solar_collector(tmp_path):
+    assert etl_collect.collect(tmp_path / 'all', accounts, datetime(2023, 7, 11), tz) == {}
+    etl_collect_fus.collect(tmp_path / 'fus', 'user', 'password', datetime(2023, 7, 11), tz, {'plants': 3})
+    files = sorted(f.relative_to(tmp_path / 'fus') for f in (tmp_path / 'fus').glob('**/*.csv'))
+    assert files == sorted(f.relative_to(tmp_path / 'all' / 'fusion_solar')
+                           for f in (tmp_path / 'all' / 'fusion_solar').glob('2023/*.csv'))
+    for f in files:
+        assert (tmp_path / 'all' / 'fusion_solar' / f).read_bytes() == (tmp_path / 'fus' / f).read_bytes()
+
+
+def test_realtime_samples_are_merged(tmp_path):
+    etl_collect.collect(tmp_path, accounts, datetime(2023, 7, 11, 12), tz)
+    etl_collect.collect(tmp_path, accounts, datetime(2023, 7, 11, 13), tz)
+    for path, plants in [(tmp_path / 'fusion_solar', 3), (tmp_path / 'fusion_solar' / 'other', 2)]:
+        partition = path / '2023' / 'realtime_2023-07-11.csv'
+        assert len(partition.read_text().splitlines()) == 1 + 2 * plants
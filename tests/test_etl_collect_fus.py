@@ -0,0 +1,67 @@
+import json
+import logging
+import shutil
+import pandas as pd
+import pytz
+from pathlib import Path
+from datetime import datetime
+
+import src.std_utils as std_utils
+import etl_collect_fus
+from src.providers import FusionSolar
+from src.ring_buffer import RingBuffer
+
+config = Path(__file__).parent.parent / 'src' / 'fus2std.json'
+tz = pytz.timezone('Europe/Paris')
+
+
+def sample(minute: int):
+    return {'stationCode': 'NE=1', 'collectTime': pd.Timestamp(2023, 7, 11, 12, minute, tz='Europe/Paris'),
+            'day_power': float(minute)}
+
+
+def test_flush_buffer_reports_dropped_samples(tmp_path, caplog):
+    buffer = RingBuffer(2)
+    for minute in range(5):
+        buffer.append('NE=1', sample(minute))
+    with caplog.at_level(logging.WARNING):
+        etl_collect_fus.flush_buffer(tmp_path, buffer, 'csv')
+        assert [r.getMessage() for r in caplog.records] == ['3 realtime samples dropped from full buffer.']
+        caplog.clear()
+        buffer.append('NE=1', sample(5))
+        etl_collect_fus.flush_buffer(tmp_path, buffer, 'csv')
+        assert caplog.records == []
+    partition = pd.read_csv(tmp_path / '2023' / 'realtime_2023-07-11.csv')
+    assert list(partition['day_power']) == [3., 4., 5.]
+
+
+def test_backfill_keeps_collected_alarms(tmp_path):
+    mock, day = {'plants': 300}, datetime(2023, 7, 11)
+    etl_collect_fus.collect(tmp_path, 'user', 'password', datetime(2023, 7, 10, 12), tz, mock)
+    with FusionSolar({'mock': mock}, tz) as provider:
+        codes = provider.plant_codes(provider.plants())
+        backfilled = provider.alarms(codes, datetime(2023, 7, 1), day)
+        collected = provider.alarms(codes, datetime(2023, 7, 9, 12), day.replace(hour=23))
+    keys = etl_collect_fus.merged_keys()['alarms']
+    expected = pd.concat([backfilled, collected])[keys].drop_duplicates()
+    assert len(expected) > max(len(backfilled), len(collected))
+
+    for order in ['backfill', 'collect'], ['collect', 'backfill']:
+        output = tmp_path / '_'.join(order)
+        shutil.copytree(tmp_path / '2023', output / '2023')
+        shutil.copy(tmp_path / '.alarms.json', output)
+        for run in order:
+            if run == 'backfill':
+                etl_collect_fus.backfill(output, 'user', 'password', datetime(2023, 7, 1), day, tz, mock)
+            else:
+                etl_collect_fus.collect(output, 'user', 'password', day.replace(hour=23), tz, mock)
+        merged = pd.read_csv(output / '2023' / 'alarms_2023-07-11.csv', dtype=str)
+        assert not merged.duplicated(keys).any()
+        assert len(merged) == len(expected)
+
+
+def test_merged_keys_are_primary_keys():
+    with open(config) as f:
+        columns = json.load(f)['columns']
+    for name, keys in etl_collect_fus.merged_keys().items():
+        assert [columns[key] for key in keys] == std_utils.primary_keys()[name]
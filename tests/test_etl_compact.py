@@ -0,0 +1,26 @@
+import pandas as pd
+from datetime import datetime
+
+import src.std_utils as std_utils
+import etl_compact
+
+
+def partition(path, day: int):
+    std_utils.to_csv(pd.DataFrame({'plant_code': ['NE=1'], 'collect_time': [datetime(2023, 7, day)]}),
+                     path / std_utils.format_filename('hourly', datetime(2023, 7, day),
+                                                      'csv' if day % 2 else 'parquet'))
+
+
+def test_compact(tmp_path):
+    partition(tmp_path, 1)
+    partition(tmp_path, 3)
+    etl_compact.compact(tmp_path, datetime(2023, 8, 1))
+    assert [f.name for f in (tmp_path / '2023').iterdir()] == ['hourly_2023-07.csv']
+
+
+def test_mixed_formats_are_not_compacted(tmp_path):
+    for day in [1, 2, 3]:
+        partition(tmp_path, day)
+    etl_compact.compact(tmp_path, datetime(2023, 8, 1))
+    assert sorted(f.name for f in (tmp_path / '2023').iterdir()) == [
+        'hourly_2023-07-01.csv', 'hourly_2023-07-02.parquet', 'hourly_2023-07-03.csv']
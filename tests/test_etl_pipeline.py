@@ -0,0 +1,72 @@
+import shutil
+import pytz
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import etl_collect_fus
+import etl_pipeline
+
+config = Path(__file__).parent.parent / 'src' / 'fus2std.json'
+tz = pytz.timezone('Europe/Paris')
+
+
+def run(output: Path, date: datetime):
+    return etl_pipeline.pipeline(output, 'user', 'password', date, tz, {'plants': 3}, config)
+
+
+def aggregated(output: Path):
+    return {f.name: f.read_bytes() for f in (output / 'agg').glob('*.csv')}
+
+
+def test_in_order_dates_are_merged(tmp_path):
+    assert run(tmp_path, datetime(2023, 7, 11)) == []
+    before = aggregated(tmp_path)
+    shutil.rmtree(tmp_path / 'std')
+    shutil.rmtree(tmp_path / 'raw')
+    assert run(tmp_path, datetime(2023, 7, 12)) == []
+    after = aggregated(tmp_path)
+    assert len(after['hourly.csv'].splitlines()) == 2 * \
+        len(before['hourly.csv'].splitlines()) - 1
+
+
+def test_out_of_order_date_keeps_aggregated_files(tmp_path):
+    run(tmp_path, datetime(2023, 7, 11))
+    run(tmp_path, datetime(2023, 7, 12))
+    before = aggregated(tmp_path)
+    shutil.rmtree(tmp_path / 'std')
+    shutil.rmtree(tmp_path / 'raw')
+    stale = run(tmp_path, datetime(2023, 7, 10))
+    assert 'hourly' in stale and 'realtime' in stale
+    after = aggregated(tmp_path)
+    for name in ['hourly.csv', 'realtime.csv', 'alarms.csv']:
+        assert after[name] == before[name]
+
+
+def test_missing_manifest_keeps_aggregated_files(tmp_path):
+    run(tmp_path, datetime(2023, 7, 11))
+    before = aggregated(tmp_path)
+    (tmp_path / 'agg' / 'manifest.json').unlink()
+    stale = run(tmp_path, datetime(2023, 7, 12))
+    assert 'hourly' in stale
+    assert aggregated(tmp_path)['hourly.csv'] == before['hourly.csv']
+
+
+def test_alarms_overlap(tmp_path, monkeypatch):
+    overlaps = []
+    query_alarms = etl_collect_fus.query_alarms
+
+    def spied(*args):
+        overlaps.append(args[-1])
+        return query_alarms(*args)
+    monkeypatch.setattr(etl_collect_fus, 'query_alarms', spied)
+    etl_pipeline.pipeline(tmp_path, 'user', 'password', datetime(2023, 7, 11), tz, {'plants': 3}, config,
+                          alarms_overlap=timedelta(days=3))
+    assert overlaps == [timedelta(days=3)]
+
+
+def test_same_day_keeps_realtime_samples(tmp_path):
+    run(tmp_path, datetime(2023, 7, 11, 12))
+    run(tmp_path, datetime(2023, 7, 11, 13))
+    std = tmp_path / 'std' / 'fusion_solar' / '2023' / 'realtime_2023-07-11.csv'
+    assert len(std.read_text().splitlines()) == 1 + 2 * 3
+    assert len(aggregated(tmp_path)['realtime.csv'].splitlines()) == 1 + 2 * 3
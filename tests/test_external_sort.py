@@ -0,0 +1,111 @@
+import tracemalloc
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import src.std_utils as std_utils
+import src.external_sort as external_sort
+import etl_aggregate
+
+keys = std_utils.primary_keys()['hourly']
+
+
+def partitions(root: Path, files: int, plants: int):
+    '''
+    Writes daily hourly partitions, each one also restating part of the previous day. Last partition
+    dates have milliseconds, so that dates are written with milliseconds from there.
+    '''
+    rng = np.random.default_rng(0)
+    codes = np.repeat(['NE=%08d' % p for p in range(plants)], 24)
+    begin = datetime(2023, 1, 1)
+    filenames = []
+    for index in range(files):
+        frames = []
+        for day in [index - 1, index] if index else [index]:
+            times = pd.date_range(begin + timedelta(days=day), periods=24, freq='h')
+            if index == files - 1:
+                times += pd.to_timedelta(rng.integers(0, 1000, 24), unit='ms')
+            frame = pd.DataFrame({
+                'plant_code': pd.Categorical(codes),
+                'collect_time': np.tile(times.values, plants),
+                'inverter_power': rng.random(24 * plants) * 10})
+            if day < index:
+                frame = frame.sample(frac=.3, random_state=index)
+            frames.append(frame)
+        filename = root / std_utils.format_filename('hourly', begin + timedelta(days=index))
+        std_utils.to_csv(pd.concat(frames), filename)
+        filenames.append(filename)
+    return filenames
+
+
+def in_memory(filenames: list, dfile: Path, keys: list):
+    etl_aggregate.write_aggregated(std_utils.merge(
+        std_utils.read_csvs(filenames), keys), dfile, 'hourly')
+
+
+def streamed(filenames: list, dfile: Path, keys: list, memory: int):
+    by = etl_aggregate.sort_columns(std_utils.file_columns(filenames[0]))
+    return external_sort.sort_merge(filenames, dfile, by, keys, memory)
+
+
+@pytest.mark.parametrize('keyed', [True, False])
+def test_full(tmp_path, keyed):
+    filenames = partitions(tmp_path / 'std', 10, 5)
+    in_memory(filenames, tmp_path / 'memory.csv', keys if keyed else None)
+    rows = streamed(filenames, tmp_path / 'streamed.csv', keys if keyed else None, 1 << 16)
+    reference = (tmp_path / 'memory.csv').read_bytes()
+    assert (tmp_path / 'streamed.csv').read_bytes() == reference
+    assert rows == len(reference.splitlines()) - 1
+
+
+@pytest.mark.parametrize('keyed', [True, False])
+def test_incremental(tmp_path, keyed):
+    filenames = partitions(tmp_path / 'std', 10, 5)
+    dfile = tmp_path / 'hourly.csv'
+    in_memory(filenames[:6], dfile, keys if keyed else None)
+    in_memory([dfile] + filenames[6:], tmp_path / 'memory.csv', keys if keyed else None)
+    streamed([dfile] + filenames[6:], tmp_path / 'streamed.csv', keys if keyed else None, 1 << 16)
+    assert (tmp_path / 'streamed.csv').read_bytes() == (tmp_path / 'memory.csv').read_bytes()
+
+
+def test_merge_passes(tmp_path, monkeypatch):
+    filenames = partitions(tmp_path / 'std', 40, 5)
+    in_memory(filenames, tmp_path / 'memory.csv', keys)
+
+    written = []
+    write_run = external_sort.write_run
+
+    def counted(batches, path, rows):
+        written.append(path.suffix)
+        return write_run(batches, path, rows)
+    monkeypatch.setattr(external_sort, 'write_run', counted)
+    streamed(filenames, tmp_path / 'streamed.csv', keys, 1 << 14)
+    assert written.count('.run') > external_sort._fanin
+    assert '.merged' in written
+    assert (tmp_path / 'streamed.csv').read_bytes() == (tmp_path / 'memory.csv').read_bytes()
+
+
+def test_empty(tmp_path):
+    filename = tmp_path / 'hourly_2023-01-01.csv'
+    pd.DataFrame(columns=['plant_code', 'collect_time']).to_csv(filename, index=False)
+    assert streamed([filename], tmp_path / 'hourly.csv', keys, 1 << 16) == 0
+    assert not (tmp_path / 'hourly.csv').exists()
+
+
+def test_peak_memory(tmp_path):
+    filenames = partitions(tmp_path / 'std', 60, 100)
+    memory = 2 << 20
+
+    def peak(func, *args):
+        tracemalloc.start()
+        func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    reference = peak(in_memory, filenames, tmp_path / 'memory.csv', keys)
+    output = peak(streamed, filenames, tmp_path / 'streamed.csv', keys, memory)
+    assert (tmp_path / 'streamed.csv').read_bytes() == (tmp_path / 'memory.csv').read_bytes()
+    assert output < 2 * memory < reference
@@ -0,0 +1,61 @@
+from pathlib import Path
+
+from benchmarks.synthetic import FakeDrive
+
+
+class ChangesDrive(FakeDrive):
+    '''
+    Fake Drive logging changes, whose token is the number of changes.
+    '''
+
+    def __init__(self, cache: Path):
+        super().__init__(jobs=2)
+        self.cache = cache
+        self.changes = []
+        self.listed = 0
+        self.external = None
+
+    def changes_token(self):
+        return str(len(self.changes))
+
+    def changes_since(self, token: str):
+        return set(self.changes[int(token):]), self.changes_token()
+
+    def store(self, file):
+        super().store(file)
+        self.changes.append(file['id'])
+
+    def _list_remote_tree(self, id: str):
+        self.listed += 1
+        tree = super()._list_remote_tree(id)
+        if self.external:  # Changed by someone else once listed
+            self.external.Upload()
+        return tree
+
+
+def local_tree(root: Path, names: list):
+    for name in names:
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text(name)
+    return root
+
+
+def test_own_changes_keep_cache(tmp_path):
+    drive = ChangesDrive(tmp_path / 'tree.json')
+    local = local_tree(tmp_path / 'local', ['2023/hourly_2023-07-01.csv'])
+    drive.upload(local, 'root', Path('std'), '*')
+    local_tree(local, ['2023/hourly_2023-07-02.csv'])
+    drive.upload(local, 'root', Path('std'), '*')
+    assert drive.listed == 1
+    summary = drive.upload(local, 'root', Path('std'), '*')
+    assert drive.listed == 1 and summary['skipped_files'] == 2
+
+
+def test_external_changes_invalidate_cache(tmp_path):
+    drive = ChangesDrive(tmp_path / 'tree.json')
+    local = local_tree(tmp_path / 'local', ['2023/hourly_2023-07-01.csv'])
+    drive.external = drive.CreateFile({'title': 'other.csv', 'parents': [{'id': 'root'}], 'mimeType': ''})
+    drive.upload(local, 'root', Path('std'), '*')
+    drive.external = None
+    drive.upload(local, 'root', Path('std'), '*')
+    assert drive.listed == 2
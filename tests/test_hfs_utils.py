@@ -0,0 +1,69 @@
+import copy
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+import pytz
+import pyhfs
+from pyhfs import exception
+
+import src.hfs_utils as hfs_utils
+from benchmarks.bench_flatten import flatten_loop
+
+
+class ExpiringSession(pyhfs.Session):
+    '''
+    Session whose token is replaced by each login, so that a login invalidates requests sent before.
+    '''
+
+    def __init__(self):
+        super().__init__('user', 'password')
+        self.token = self.sent = self.logins = 0
+        self.lock = threading.Lock()
+
+    def login(self):
+        time.sleep(.01)
+        with self.lock:
+            self.logins += 1
+            self.token += 1
+            self.sent = self.token
+
+    def _raw_post(self, endpoint, parameters={}):
+        sent = self.sent
+        time.sleep(.005)
+        if sent != self.token:
+            raise exception._305_NotLogged(305, 'You are not in the login state.')
+        return None, {'success': True}
+
+
+@pytest.mark.parametrize('data', [
+    [],
+    [{'stationCode': 'NE=1', 'dataItemMap': {'real_health_state': '3', 'day_power': '1.5'}},
+     {'stationCode': 'NE=2', 'collectTime': 1688162400000, 'dataItemMap': {'inverter_power': 2., 'ongrid_power': None}},
+     {'stationCode': 'NE=3', 'collectTime': 1688166000000, 'dataItemMap': {}},
+     {'stationCode': 'NE=4', 'alarmId': 2064, 'raiseTime': 1688162400123, 'lev': 2}],
+    [{'stationCode': 'NE=4', 'alarmId': 2064, 'raiseTime': 1688162400123, 'lev': 2},
+     {'stationCode': 'NE=2', 'collectTime': 1688162400000, 'dataItemMap': {'inverter_power': 2.}}]])
+def test_flatten(data):
+    tz = pytz.timezone('Europe/Paris')
+    original = copy.deepcopy(data)
+    # Former implementation mutates its input, so it gets its own copy
+    pd.testing.assert_frame_equal(hfs_utils.flatten(data, tz), flatten_loop(copy.deepcopy(data), tz))
+    assert data == original
+
+
+def test_throttled():
+    assert hfs_utils.is_throttled(pyhfs.FrequencyLimit(407, 'Too frequent.'))
+    assert not hfs_utils.is_throttled(pyhfs.FrequencyLimit(20618, 'Daily limit.'))
+    assert not hfs_utils.is_throttled(pyhfs.Permission(401, 'Denied.'))
+
+
+def test_locked_login():
+    session = hfs_utils.locked_login(ExpiringSession())
+    session.login()
+    session.token += 1  # Expires
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda i: session.post('getStationRealKpi'), range(64)))
+    assert session.logins == 2
@@ -0,0 +1,12 @@
+import pyhfs
+from datetime import datetime
+
+from src.mock_session import MockSession
+
+
+def test_plant_list_pages():
+    with pyhfs.Client(MockSession(plants=250, page_size=30)) as client:
+        plants = client.get_plant_list()
+        assert len(plants) == 250
+        codes = [plant['plantCode'] for plant in plants]
+        assert len(client.get_plant_hourly_data(codes, datetime(2023, 7, 11))) == 250 * 24
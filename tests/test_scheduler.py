@@ -0,0 +1,88 @@
+import threading
+import time
+import pytest
+
+import src.scheduler as scheduler
+from src.scheduler import Scheduler, failures
+import etl_collect_fus
+
+
+class Throttled(Exception):
+    pass
+
+
+class Flaky:
+    '''
+    Task failing its first 'failures' calls, with a new exception each time.
+    '''
+
+    def __init__(self, failures: int, error=Throttled):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+        self.raised = []
+
+    def __call__(self, value):
+        self.calls += 1
+        if self.calls <= self.failures:
+            self.raised.append(self.error('call %d' % self.calls))
+            raise self.raised[-1]
+        return value
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    '''
+    Records retry delays instead of sleeping, jitter always drawing the maximum delay.
+    '''
+    delays = []
+    monkeypatch.setattr(scheduler.time, 'sleep', delays.append)
+    monkeypatch.setattr(scheduler.random, 'uniform', lambda a, b: b)
+    return delays
+
+
+def retrying(**kwargs):
+    return Scheduler(is_retryable=lambda e: isinstance(e, Throttled), **kwargs)
+
+
+def test_retries_with_backoff(delays):
+    task = Flaky(4)
+    outcome = retrying(retries=5, backoff=1., max_backoff=4.).attempt('task', task, 'value')
+    assert outcome['result'] == 'value' and outcome['error'] is None
+    assert task.calls == outcome['attempts'] == 5
+    assert delays == [1., 2., 4., 4.]
+
+
+def test_last_error_is_propagated(delays):
+    task = Flaky(10)
+    outcomes = retrying(retries=3).run({'task': (task, 'value')})
+    assert task.calls == outcomes['task']['attempts'] == 4
+    assert len(delays) == 3
+    assert failures(outcomes) == ['task']
+    with pytest.raises(Throttled) as error:
+        etl_collect_fus.raise_failures(outcomes)
+    assert error.value is task.raised[-1]
+
+
+def test_not_retryable_error(delays):
+    task = Flaky(1, ValueError)
+    outcomes = retrying(retries=3).run({'task': (task, 'value'), 'other': (Flaky(0), 'other')})
+    assert task.calls == 1 and delays == []
+    assert isinstance(outcomes['task']['error'], ValueError)
+    assert outcomes['other']['result'] == 'other'
+
+
+def test_concurrency_bound():
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def task():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(.02)
+        with lock:
+            running[0] -= 1
+
+    Scheduler(jobs=3).run({i: (task,) for i in range(12)})
+    assert peak[0] == 3
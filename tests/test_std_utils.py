@@ -0,0 +1,60 @@
+import os
+import pandas as pd
+from datetime import datetime
+
+import src.std_utils as std_utils
+
+
+def hourly(day: int, power: float):
+    return pd.DataFrame({'plant_code': ['NE=1'], 'collect_time': [datetime(2023, 7, day)],
+                         'inverter_power': [power]})
+
+
+def test_partition_files(tmp_path):
+    names = ['hourly_2023-07-01.csv', 'hourly_2023-07-02.parquet', 'hourly_2023-07-02.csv',
+             'hourly_2023-07.parquet', 'hourly_2023-07-03.csv.tmp']
+    for mtime, name in enumerate(names):
+        (tmp_path / name).touch()
+        os.utime(tmp_path / name, (mtime, mtime))
+    assert [f.name for f in std_utils.partition_files(tmp_path.glob('*'))] == [
+        'hourly_2023-07.parquet', 'hourly_2023-07-01.csv', 'hourly_2023-07-02.csv']
+
+
+def test_from_csvs_mixed_formats(tmp_path):
+    std_utils.to_csv(hourly(1, 1.), tmp_path / 'hourly_2023-07-01.csv')
+    std_utils.to_csv(hourly(2, 2.), tmp_path / 'hourly_2023-07-02.csv')
+    std_utils.to_csv(hourly(2, 3.), tmp_path / 'hourly_2023-07-02.parquet')
+    os.utime(tmp_path / 'hourly_2023-07-02.csv', (0, 0))
+    data = std_utils.from_csvs(tmp_path, 'hourly_*.*')
+    assert list(data['inverter_power']) == [1., 3.]
+
+
+def test_merge_latest_wins():
+    earlier = pd.concat([hourly(1, 1.), hourly(2, 2.)], ignore_index=True)
+    data = std_utils.merge([earlier, hourly(2, 3.)], std_utils.primary_keys()['hourly'])
+    assert list(data['collect_time'].dt.day) == [1, 2]
+    assert list(data['inverter_power']) == [1., 3.]
+
+
+def alarm(device: str, day: int, severity: str):
+    return {'plant_code': 'NE=1', 'device_sn': device, 'alarm_id': 2064,
+            'alarm_raise_time': datetime(2023, 7, day, 10), 'alarm_severity': severity}
+
+
+def test_merge_restated_alarm():
+    earlier = pd.DataFrame([alarm('ES1', 1, 'Minor'), alarm('ES1', 2, 'Minor')])
+    later = pd.DataFrame([alarm('ES1', 1, 'Major'), alarm('ES2', 1, 'Minor')])
+    data = std_utils.merge([earlier, later], std_utils.primary_keys()['alarms'])
+    assert [(a.device_sn, a.alarm_raise_time.day, a.alarm_severity) for a in data.itertuples()] == [
+        ('ES1', 2, 'Minor'), ('ES1', 1, 'Major'), ('ES2', 1, 'Minor')]
+
+
+def test_from_csvs_without_keys(tmp_path):
+    # Partitions lack collect_time, only identical entries are duplicated ones, the latest one is kept
+    std_utils.to_csv(pd.DataFrame({'plant_code': ['NE=1', 'NE=2'], 'inverter_power': [1., 2.]}),
+                     tmp_path / 'hourly_2023-07-01.csv')
+    std_utils.to_csv(pd.DataFrame({'plant_code': ['NE=1', 'NE=2'], 'inverter_power': [1., 3.]}),
+                     tmp_path / 'hourly_2023-07-02.csv')
+    data = std_utils.from_csvs(tmp_path, 'hourly_*.csv')
+    assert list(zip(data['plant_code'], data['inverter_power'])) == [
+        ('NE=2', 2.), ('NE=1', 1.), ('NE=2', 3.)]